@@ -3,13 +3,23 @@
 # @time    : 2024/8/21 16:32
 # @author  : timger/yishenggudou
 import asyncio
+import functools
+import json
 import logging
+import os
 import sys
+import tempfile
 from pathlib import Path
 import yaml
 import typer
 from typing import Optional
-from py_cdp_reactive_flow_bot.engine import ReactiveAutomationFramework
+from py_cdp_reactive_flow_bot.engine import ReactiveAutomationFramework, validate_url_patterns
+
+# 优先使用基于libyaml的C解析器，解析速度远快于纯Python实现
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 # 配置日志
 logging.basicConfig(
@@ -21,6 +31,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+if SafeLoader is yaml.SafeLoader:
+    logger.warning("PyYAML未启用libyaml支持，将回退到纯Python解析器，playbook加载速度会明显变慢")
+
 # 创建Typer应用实例
 app = typer.Typer(
     name="py-cdp-reactive-flow-bot",
@@ -44,10 +57,20 @@ def run(
         "-c",
         help="CDP服务端点地址，例如: http://localhost:9222"
     ),
+    persistent_browser: bool = typer.Option(
+        False,
+        "--persistent-browser",
+        help="复用跨进程常驻的浏览器实例，不存在时自动启动，执行结束后保持运行"
+    ),
     debug: bool = typer.Option(
         False,
         "--debug",
         help="启用调试日志模式"
+    ),
+    no_cache: bool = typer.Option(
+        False,
+        "--no-cache",
+        help="不读取也不写入playbook解析缓存"
     )
 ):
     """运行指定的playbook自动化脚本"""
@@ -56,41 +79,109 @@ def run(
         logger.setLevel(logging.DEBUG)
         logging.getLogger("py_cdp_reactive_flow_bot").setLevel(logging.DEBUG)
     
-    logger.info(f"开始执行playbook: {playbook}")
-    logger.debug(f"CDP端点配置: {cdp_endpoint or '使用默认Playwright浏览器'}")
+    logger.info("开始执行playbook: %s", playbook)
+    logger.debug("CDP端点配置: %s", cdp_endpoint or '使用默认Playwright浏览器')
     
     try:
         # 读取并解析YAML playbook文件
-        playbook_config = load_playbook(playbook)
+        playbook_config = load_playbook(playbook, use_cache=not no_cache)
         
         # 运行主程序逻辑
-        asyncio.run(run_playbook(playbook_config, cdp_endpoint))
+        asyncio.run(run_playbook(playbook_config, cdp_endpoint, persistent_browser))
         
         logger.info("Playbook执行完成")
         return 0
     except Exception as e:
-        logger.error(f"执行失败: {str(e)}")
+        logger.error("执行失败: %s", e)
         return 1
 
-def load_playbook(playbook_path: Path) -> dict:
-    """加载并解析YAML格式的playbook文件"""
-    logger.debug(f"加载playbook文件: {playbook_path}")
+def load_playbook(playbook_path: Path, use_cache: bool = True) -> dict:
+    """加载并解析YAML格式的playbook文件
+
+    启用缓存时，解析结果会写入playbook同目录下的 `<playbook>.cache.json` 旁路文件，
+    源文件的路径、mtime和大小都未变化时直接读取JSON，跳过YAML解析。
+    同时在进程内按相同的键做LRU缓存，重复加载同一playbook会返回同一个dict对象，
+    调用方应将返回值视为只读。
+    """
+    logger.debug("加载playbook文件: %s", playbook_path)
+    if not use_cache:
+        return _parse_playbook(playbook_path)
+    try:
+        stat = playbook_path.stat()
+    except OSError as e:
+        logger.error("读取playbook文件失败: %s", e)
+        raise IOError(f"无法读取文件: {playbook_path}") from e
+    return _load_playbook_cached(str(playbook_path), stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=128)
+def _load_playbook_cached(path_str: str, mtime_ns: int, size: int) -> dict:
+    """带进程内LRU和JSON旁路缓存的playbook加载"""
+    playbook_path = Path(path_str)
+    cache_key = [path_str, mtime_ns, size]
+    cache_path = playbook_path.with_suffix(".cache.json")
+    hit, cached = _read_playbook_cache(cache_path, cache_key)
+    if hit:
+        logger.debug("命中playbook缓存: %s", cache_path)
+        return cached
+    playbook_config = _parse_playbook(playbook_path)
+    _write_playbook_cache(cache_path, cache_key, playbook_config)
+    return playbook_config
+
+def _parse_playbook(playbook_path: Path) -> dict:
+    """解析YAML格式的playbook文件，并预先校验其中的URL正则表达式"""
     try:
         with open(playbook_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+            # 一次性读入整个文件再解析，避免按行缓冲读取
+            playbook_config = yaml.load(f.read(), Loader=SafeLoader)
     except yaml.YAMLError as e:
-        logger.error(f"解析YAML文件失败: {e}")
+        logger.error("解析YAML文件失败: %s", e)
         raise ValueError(f"无效的YAML文件格式: {playbook_path}") from e
     except Exception as e:
-        logger.error(f"读取playbook文件失败: {e}")
+        logger.error("读取playbook文件失败: %s", e)
         raise IOError(f"无法读取文件: {playbook_path}") from e
+    validate_url_patterns(playbook_config)
+    return playbook_config
+
+def _read_playbook_cache(cache_path: Path, cache_key: list) -> tuple:
+    """读取JSON旁路缓存，返回 (是否命中, 解析结果)"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return False, None
+    if not isinstance(cached, dict) or cached.get("key") != cache_key:
+        return False, None
+    return True, cached.get("data")
+
+def _write_playbook_cache(cache_path: Path, cache_key: list, playbook_config) -> None:
+    """原子地写入JSON旁路缓存，写入失败不影响playbook执行"""
+    try:
+        payload = json.dumps({"key": cache_key, "data": playbook_config}, ensure_ascii=False)
+    except (TypeError, ValueError):
+        logger.debug("playbook包含无法JSON序列化的值，跳过缓存")
+        return
+    # YAML的非字符串键、日期等在JSON往返后会变形，这种情况下不写缓存
+    if json.loads(payload)["data"] != playbook_config:
+        logger.debug("playbook无法无损转换为JSON，跳过缓存")
+        return
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=cache_path.parent, prefix=cache_path.name, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.debug("写入playbook缓存失败: %s", e)
+        if tmp_path and os.path.exists(tmp_path):
+            os.unlink(tmp_path)
 
-async def run_playbook(playbook_config: dict, cdp_endpoint: Optional[str]):
+async def run_playbook(playbook_config: dict, cdp_endpoint: Optional[str], persistent_browser: bool = False):
     """运行playbook自动化脚本
     
     Args:
         playbook_config: 解析后的playbook配置
         cdp_endpoint: CDP服务端点地址，如果为None则启动新的浏览器实例
+        persistent_browser: 未指定cdp_endpoint时复用常驻浏览器实例
     """
     # 初始化框架
     framework = ReactiveAutomationFramework()
@@ -101,7 +192,7 @@ async def run_playbook(playbook_config: dict, cdp_endpoint: Optional[str]):
     
     try:
         # 初始化浏览器环境，传入cdp_endpoint参数
-        await framework.initialize(cdp_endpoint=cdp_endpoint)
+        await framework.initialize(cdp_endpoint=cdp_endpoint, persistent_browser=persistent_browser)
         
         # 创建并执行DSL执行器
         logger.debug("创建DSL执行器")
@@ -112,19 +203,19 @@ async def run_playbook(playbook_config: dict, cdp_endpoint: Optional[str]):
             step_index = update["step_index"]
             state = update["state"]
             result = update.get("result")
-            logger.info(f"步骤 #{step_index} 状态: {state.name}")
+            logger.info("步骤 #%s 状态: %s", step_index, state)
             if result:
-                logger.debug(f"  结果: {result}")
+                logger.debug("  结果: %s", result)
         
-        state_subscription = framework.state_stream.subscribe(on_state_update)
+        remove_state_callback = framework.on_state(on_state_update)
         
         # 订阅执行器，处理结果和错误
         def on_next(result):
-            logger.debug(f"执行器产生结果: {result}")
+            logger.debug("执行器产生结果: %s", result)
         
         def on_error(error):
             nonlocal error_occurred
-            logger.error(f"执行器出错: {error}")
+            logger.error("执行器出错: %s", error)
             error_occurred = error
             completion_event.set()
         
@@ -144,7 +235,7 @@ async def run_playbook(playbook_config: dict, cdp_endpoint: Optional[str]):
         
         # 从playbook配置中获取超时时间，如果没有设置则使用默认值300秒
         timeout = playbook_config.get("timeout", 300)
-        logger.debug(f"设置执行超时时间: {timeout}秒")
+        logger.debug("设置执行超时时间: %s秒", timeout)
         
         try:
             # 等待执行完成，带超时保护
@@ -155,15 +246,15 @@ async def run_playbook(playbook_config: dict, cdp_endpoint: Optional[str]):
                 raise error_occurred
                 
         except asyncio.TimeoutError:
-            logger.error(f"执行超时: 超过{timeout}秒未完成")
+            logger.error("执行超时: 超过%s秒未完成", timeout)
             raise TimeoutError(f"Playbook执行超时，超过{timeout}秒")
             
         logger.info("Playbook执行成功完成")
             
     finally:
         # 确保清理资源
-        if 'state_subscription' in locals():
-            state_subscription.dispose()
+        if 'remove_state_callback' in locals():
+            remove_state_callback()
         if 'executor_subscription' in locals():
             executor_subscription.dispose()
         # 关闭框架资源
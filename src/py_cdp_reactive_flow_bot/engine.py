@@ -2,21 +2,161 @@
 # -*- coding: utf-8 -*-
 # @time    : 2024/8/21 16:32
 # @author  : timger/yishenggudou
+from __future__ import annotations
+
 import asyncio
+import json
+import os
 import re
-from typing import Any, Dict, List, Callable, Optional
+import subprocess
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Dict, List, Callable, Optional, Tuple
 from enum import Enum
-from dataclasses import dataclass
-import asyncio
-import rx
-from rx import operators as ops
-from rx.core import Observable
-from rx.subject import Subject
-from rx.scheduler.eventloop import AsyncIOScheduler
-from playwright.async_api import async_playwright, Page, BrowserContext
+from dataclasses import dataclass, field
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from py_cdp_reactive_flow_bot.utils import compile_pattern
 logger = logging.getLogger(__name__)
 
+# playwright 和 rx 导入耗时较长，只在真正需要时导入，运行 --help 等命令时不加载
+if TYPE_CHECKING:
+    from playwright.async_api import Browser, Page, BrowserContext, CDPSession, Locator
+    from rx.core import Observable
+    from rx.disposable import Disposable
+
+# 状态更新等小字典的序列化优先使用orjson，未安装时回退到标准库json
+try:
+    import orjson
+    _dumps = orjson.dumps
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        """与orjson.dumps输出格式一致的回退实现"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# Python 3.11+ 的 asyncio.timeout 在当前任务内计时，不像3.12之前的 wait_for 那样为每个步骤额外创建任务；
+# 3.10 回退到 wait_for
+_asyncio_timeout = getattr(asyncio, "timeout", None)
+
+# 常驻浏览器模式下的数据目录及CDP端点锁文件
+PERSISTENT_BROWSER_DIR = Path.home() / ".cache" / "py-cdp-bot"
+PERSISTENT_ENDPOINT_FILE = PERSISTENT_BROWSER_DIR / "endpoint"
+# 启动常驻浏览器时持有的文件锁，避免多个进程同时启动时争用 DevToolsActivePort 和锁文件
+PERSISTENT_LAUNCH_LOCK_FILE = PERSISTENT_BROWSER_DIR / "launch.lock"
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _try_lock_file(f) -> bool:
+    """以非阻塞方式对已打开的文件加排他锁，锁被其他进程持有时返回False；文件关闭时自动释放"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+@asynccontextmanager
+async def _persistent_launch_lock(timeout: float = 60):
+    """跨进程互斥地执行常驻浏览器的启动，轮询等待锁以免阻塞事件循环"""
+    PERSISTENT_BROWSER_DIR.mkdir(parents=True, exist_ok=True)
+    with open(PERSISTENT_LAUNCH_LOCK_FILE, 'a+b') as f:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not _try_lock_file(f):
+            if loop.time() > deadline:
+                raise TimeoutError(f"等待常驻浏览器启动锁超时，超过{timeout}秒")
+            await asyncio.sleep(0.1)
+        yield
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str) -> re.Pattern:
+    """编译正则表达式并缓存，避免每次匹配时重复编译"""
+    return re.compile(pattern)
+
+def validate_url_patterns(dsl_config: Dict) -> None:
+    """预编译playbook中所有url类型的模式，在启动浏览器之前暴露无效的正则表达式
+    
+    覆盖 wait_for_pattern 步骤以及 pattern_match 类型的 conditional 步骤。
+    """
+    if not isinstance(dsl_config, dict):
+        return
+    for i, step in enumerate(dsl_config.get("steps") or []):
+        if isinstance(step, dict):
+            _validate_step_url_pattern(step, i)
+
+def _validate_step_url_pattern(step: Dict[str, Any], step_index: int) -> None:
+    """编译单个步骤中的url模式，同时预热 _compile 缓存，无效时抛出ValueError"""
+    pattern = step.get("pattern")
+    condition = step.get("condition")
+    if isinstance(condition, dict) and condition.get("type") == "pattern_match":
+        pattern = condition.get("pattern")
+    if not isinstance(pattern, dict) or pattern.get("type") != "url":
+        return
+    try:
+        _compile(pattern["value"])
+    except (KeyError, TypeError, re.error) as e:
+        raise ValueError(f"步骤 #{step_index} 的URL模式无效: {pattern.get('value')!r}: {e}") from e
+
+# 一次读取多个选择器文本的JS函数，参数为 {配置项: 选择器} 映射，元素不存在时为null
+_SELECTOR_TEXT_SCRIPT = (
+    "sels => Object.fromEntries(Object.entries(sels).map("
+    "([k, s]) => [k, document.querySelector(s)?.textContent ?? null]))"
+)
+
+# 缓冲的状态更新达到该数量时立即发出，不再等待下一轮事件循环
+_STATE_BUFFER_SIZE = 16
+
+class _Emitter:
+    """轻量的事件发射器，代替只用来通知少量订阅者的Rx Subject
+    
+    订阅者列表在订阅和取消订阅时整体替换，发射时直接遍历，不需要加锁或复制。
+    """
+    __slots__ = ("_subscribers",)
+    
+    def __init__(self):
+        self._subscribers: Tuple[Callable[[Any], None], ...] = ()
+    
+    def __bool__(self) -> bool:
+        return bool(self._subscribers)
+    
+    def subscribe(self, on_next: Any = None, on_error: Any = None, on_completed: Any = None, **kwargs) -> Disposable:
+        """兼容Rx的订阅方式，on_next 可以是回调函数或带 on_next 方法的观察者
+        
+        发射器不会结束或出错，on_error、on_completed 及 scheduler 等参数被忽略。
+        """
+        from rx.disposable import Disposable
+        
+        callback = getattr(on_next, "on_next", on_next)
+        if callback is None:
+            return Disposable()
+        self._subscribers += (callback,)
+        
+        def remove():
+            subscribers = list(self._subscribers)
+            if callback in subscribers:
+                subscribers.remove(callback)
+                self._subscribers = tuple(subscribers)
+        return Disposable(remove)
+    
+    def on_next(self, value: Any):
+        """依次通知订阅者；单个订阅者抛出的异常只记录日志，不影响其余订阅者和发射方"""
+        for callback in self._subscribers:
+            try:
+                callback(value)
+            except Exception:
+                logger.exception("状态订阅者处理更新失败")
+
 class TaskState(Enum):
     PENDING = "pending"
     RUNNING = "running"
@@ -24,12 +164,161 @@ class TaskState(Enum):
     FAILED = "failed"
     RETRYING = "retrying"
 
-@dataclass
+# 每次执行各自一个上下文，按对象身份比较和哈希
+@dataclass(slots=True, eq=False)
 class ExecutionContext:
     page: Page
     data: Dict[str, Any]
-    state: Dict[str, Any]
     last_result: Any = None
+    current_step: int = 0  # 最近一次执行成功的步骤序号
+    retry_count: int = 0  # 当前步骤已重试的次数
+    browser_context: Optional[BrowserContext] = None
+    owns_browser_context: bool = False  # 上下文由本次执行创建，执行结束后需要关闭
+    cdp_session: Optional[CDPSession] = None  # 当前页面复用的CDP会话，首次使用时创建
+    locators: Dict[str, Locator] = field(default_factory=dict)  # 按选择器缓存的Locator，导航后清空
+    
+    def locator(self, selector: str) -> Locator:
+        """获取选择器对应的Locator，同一页面内重复操作同一元素时复用
+        
+        取第一个匹配的元素，与 page.click/page.fill 的非严格匹配行为一致。
+        """
+        locator = self.locators.get(selector)
+        if locator is None:
+            locator = self.locators[selector] = self.page.locator(selector).first
+        return locator
+
+@dataclass(slots=True)
+class CompiledStep:
+    """创建执行器时从步骤配置预先解析出的步骤，执行过程中只做属性访问"""
+    index: int
+    type: str
+    name: str
+    timeout: Optional[int]  # 毫秒，0或None表示不套用步骤级超时
+    timeout_seconds: Optional[float]  # 换算为秒的超时，供 asyncio.timeout 或 wait_for 直接使用，不限超时为None
+    max_retries: int
+    payload: Dict[str, Any]  # 原始步骤配置，已校验包含该步骤类型的必填字段
+    next_step_patterns: Tuple[Dict[str, Any], ...] = ()
+    # 由跳转规则预编译的 (匹配函数, 目标步骤) 表，按规则顺序排列
+    next_step_routes: Tuple[Tuple[Callable[[Dict[str, Any]], bool], int], ...] = ()
+    # 跳转规则中是否有对提取数据做深度匹配的data规则，只有这类规则才值得放到线程池中匹配
+    routes_match_data: bool = False
+    # 预先生成的执行函数，步骤参数已绑定在闭包中
+    run: Optional[Callable[["ExecutionContext"], Awaitable[Dict[str, Any]]]] = None
+
+# 各步骤类型的必填字段
+_REQUIRED_STEP_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "navigate": ("url",),
+    "click": ("selector",),
+    "type": ("selector", "text"),
+    "wait_for_pattern": ("pattern",),
+    "extract_data": ("extract",),
+    "conditional": ("condition",),
+    "cdp_command": ("command",),
+}
+
+# 这些步骤的Playwright调用自带超时（动作默认30秒，模式等待默认5秒），
+# 未显式配置timeout时不再额外套一层Rx超时
+_SELF_TIMED_STEP_TYPES = frozenset({"navigate", "click", "type", "wait_for_pattern"})
+
+_MISSING = object()
+
+# 步骤结果的匹配函数，以及匹配函数缓存中的 (模式对象, 匹配函数) 项
+ResultMatcher = Callable[[Dict[str, Any]], bool]
+MatcherCache = Dict[int, Tuple[Dict[str, Any], ResultMatcher]]
+
+# 框架级跳转模式缓存的容量，超出后淘汰最久未使用的模式
+MATCHER_CACHE_SIZE = 256
+
+class _LRUCache(OrderedDict):
+    """容量有限的LRU缓存，写入超出容量时淘汰最久未使用的项"""
+    
+    def __init__(self, maxsize: int):
+        super().__init__()
+        self.maxsize = maxsize
+    
+    def get(self, key: Any, default: Any = None) -> Any:
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+    
+    def __setitem__(self, key: Any, value: Any):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
+def compile_step(step: Dict[str, Any], step_index: int, matcher_cache: Optional[MatcherCache] = None) -> CompiledStep:
+    """把一个步骤配置解析为 CompiledStep，缺少必填字段或类型未知时抛出ValueError
+    
+    传入 matcher_cache 时，同一个跳转模式对象只编译一次，见 compile_result_matcher。
+    """
+    step_type = step.get("type")
+    required = _REQUIRED_STEP_FIELDS.get(step_type)
+    if required is None:
+        raise ValueError(f"未知的步骤类型: {step_type}")
+    missing = [field for field in required if field not in step]
+    if missing:
+        raise ValueError(f"步骤 #{step_index} ({step_type}) 缺少字段: {', '.join(missing)}")
+    # 直接传给 create_dsl_executor 的配置不经过加载阶段的校验，这里统一编译一次url模式
+    _validate_step_url_pattern(step, step_index)
+    next_step_patterns = tuple(step.get("next_step_patterns", ()))
+    try:
+        next_step_routes = tuple(
+            (compile_result_matcher(rule["pattern"], matcher_cache), rule["goto_step"]) for rule in next_step_patterns
+        )
+        routes_match_data = any(rule["pattern"]["field"] == "data" for rule in next_step_patterns)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"步骤 #{step_index} ({step_type}) 的跳转规则无效: {e}") from e
+    timeout = step.get("timeout", _MISSING)
+    if timeout is _MISSING:
+        timeout = None if step_type in _SELF_TIMED_STEP_TYPES else 30000  # 默认30秒
+    return CompiledStep(
+        index=step_index,
+        type=step_type,
+        name=step.get("name", f"step_{step_index}"),
+        timeout=timeout,
+        timeout_seconds=timeout / 1000 if timeout else None,
+        max_retries=step.get("max_retries", 3),  # 默认重试3次
+        payload=step,
+        next_step_patterns=next_step_patterns,
+        next_step_routes=next_step_routes,
+        routes_match_data=routes_match_data,
+    )
+
+def compile_result_matcher(pattern: Dict[str, Any], cache: Optional[MatcherCache] = None) -> ResultMatcher:
+    """把跳转规则中的模式编译为针对步骤结果的匹配函数
+    
+    field 为 type 时比较结果类型，为 data 时对提取到的数据做深度模式匹配，其他字段不匹配。
+    cache 以模式对象的id为键，同时保存模式对象本身：既保证id不会被回收后复用，
+    也能在命中时确认是同一个对象。playbook配置在执行期间不会被修改。
+    """
+    if cache is None:
+        return _compile_result_matcher(pattern)
+    cached = cache.get(id(pattern))
+    if cached is not None and cached[0] is pattern:
+        return cached[1]
+    matcher = _compile_result_matcher(pattern)
+    cache[id(pattern)] = (pattern, matcher)
+    return matcher
+
+def _compile_result_matcher(pattern: Dict[str, Any]) -> ResultMatcher:
+    """compile_result_matcher 不带缓存的实现"""
+    field_name = pattern["field"]
+    if field_name == "type":
+        expected_type = pattern["value"]
+        if isinstance(expected_type, str):
+            # 步骤结果的type都是字符串常量，驻留后相等比较通常在身份判断时就能得出结果
+            expected_type = sys.intern(expected_type)
+        return lambda result: result.get("type") == expected_type
+    if field_name == "data":
+        match_data = compile_pattern(pattern["value"])
+        
+        def match(result: Dict[str, Any]) -> bool:
+            data = result.get("data")
+            return bool(data) and match_data(data)
+        return match
+    return lambda result: False
 
 @dataclass
 class PatternMatch:
@@ -38,41 +327,87 @@ class PatternMatch:
     timeout: int = 5000
 
 class ReactiveAutomationFramework:
-    def __init__(self, cdp_endpoint: Optional[str] = None):
+    def __init__(self, cdp_endpoint: Optional[str] = None, persistent_browser: bool = False, page_pool_size: int = 0):
         self.playwright = None
         self.browser = None
-        self.context = None
-        self.event_stream = Subject()
-        self.state_stream = Subject()
+        # 仅在连接到已有浏览器时记录其现有上下文，其余情况每次执行都会创建独立的上下文
+        self._default_context: Optional[BrowserContext] = None
+        self.event_stream = _Emitter()
+        self.state_stream = _Emitter()
+        # 待发出的状态更新，在下一轮事件循环中一次性发出
+        self._state_buffer: List[Dict[str, Any]] = []
+        self._state_flush_scheduled = False
+        # 最近一次开始的执行上下文，仅供外部查看；步骤执行使用各自传入的上下文，多次执行可以并发
         self.current_context: Optional[ExecutionContext] = None
+        # 正在进行的执行上下文，关闭框架时断开它们的CDP会话
+        self._active_contexts: set = set()
         self.cdp_endpoint: Optional[str] = cdp_endpoint
-        self.scheduler = AsyncIOScheduler(loop=asyncio.get_event_loop())
+        self.persistent_browser: bool = persistent_browser
+        # 大于0时在initialize中预先创建这么多页面，执行之间回收复用，同时也限制了并发执行数；
+        # 复用的页面只清理cookie，localStorage等状态会在执行之间保留，默认不启用
+        self.page_pool_size: int = page_pool_size
+        # 回收失败的页面在池中留下None占位，取出时再创建新页面，池的容量保持不变
+        self._page_pool: Optional[asyncio.Queue[Optional[Tuple[BrowserContext, Page, bool]]]] = None
+        # 模式匹配等CPU密集的工作放到线程池，避免阻塞事件循环；首次匹配data跳转规则时才创建
+        self._cpu_executor: Optional[ThreadPoolExecutor] = None
+        # 在initialize中绑定到实际运行的事件循环
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 供订阅者序列化状态更新，返回UTF-8编码的JSON字节串
+        self.dumps: Callable[[Any], bytes] = _dumps
+        # 步骤类型到执行函数生成器的分发表，创建执行器时为每个步骤生成一次执行函数
+        self._step_builders: Dict[str, Callable[[Dict], Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]]] = {
+            "navigate": self._build_navigate,
+            "click": self._build_click,
+            "type": self._build_type,
+            "wait_for_pattern": self._build_wait_for_pattern,
+            "extract_data": self._build_extract_data,
+            "conditional": self._build_conditional,
+            "cdp_command": self._build_cdp_command,
+        }
+        # 跳转模式编译结果的缓存，重复为同一份playbook创建执行器时复用；
+        # 容量有限，长期运行、加载大量不同playbook时不会无限增长并一直持有旧的模式对象
+        self._matcher_cache: MatcherCache = _LRUCache(MATCHER_CACHE_SIZE)
+        # 模式类型到等待函数的分发表
+        self._pattern_waiters: Dict[str, Callable[[ExecutionContext, Dict, int], Awaitable[Dict[str, Any]]]] = {
+            "url": self._wait_for_url_pattern,
+            "content": self._wait_for_content_pattern,
+            "element": self._wait_for_element_pattern,
+            "custom": self._wait_for_custom_pattern,
+        }
         
-    async def initialize(self, cdp_endpoint: Optional[str] = None):
+    async def initialize(self, cdp_endpoint: Optional[str] = None, persistent_browser: Optional[bool] = None):
         """初始化浏览器环境
         
         Args:
             cdp_endpoint: 可选的CDP服务端点地址，如果提供则连接到现有浏览器实例，
                          否则启动一个新的浏览器实例
+            persistent_browser: 未提供cdp_endpoint时，连接到跨进程复用的常驻浏览器，
+                         常驻浏览器不存在时会先启动一个，其CDP端点记录在锁文件中
         """
         logger.debug("开始初始化浏览器环境...")
+        self._loop = asyncio.get_running_loop()
+        from playwright.async_api import async_playwright
+        
         self.playwright = await async_playwright().start()
         logger.debug("Playwright启动成功")
         cdp_endpoint = cdp_endpoint or self.cdp_endpoint
-        if cdp_endpoint:
+        if persistent_browser is not None:
+            self.persistent_browser = persistent_browser
+        if not cdp_endpoint and self.persistent_browser:
+            # 常驻浏览器模式：复用其他进程启动的浏览器，省去每次启动浏览器的开销
+            self.browser = await self._connect_persistent_browser()
+            logger.debug("成功连接到常驻浏览器")
+        elif cdp_endpoint:
             # 连接到现有的CDP端点
-            logger.debug(f"连接到CDP端点: {cdp_endpoint}")
+            logger.debug("连接到CDP端点: %s", cdp_endpoint)
             self.browser = await self.playwright.chromium.connect_over_cdp(cdp_endpoint)
             logger.debug("成功连接到CDP端点")
             
-            # 获取第一个上下文，如果没有则创建新的
+            # 沿用已有浏览器的第一个上下文（保留用户的登录态等），没有则每次执行创建新的
             contexts = self.browser.contexts
             if contexts:
-                self.context = contexts[0]
+                self._default_context = contexts[0]
                 logger.debug("使用现有浏览器上下文")
-            else:
-                self.context = await self.browser.new_context()
-                logger.debug("创建新的浏览器上下文")
         else:
             # 启动新的浏览器实例
             logger.debug("启动新的Chrome浏览器实例")
@@ -81,275 +416,618 @@ class ReactiveAutomationFramework:
                 args=['--disable-blink-features=AutomationControlled']
             )
             logger.debug("Chrome浏览器启动成功")
-            
-            self.context = await self.browser.new_context()
-            logger.debug("浏览器上下文创建成功")
         
+        await self._fill_page_pool()
+    
+    async def _fill_page_pool(self):
+        """按 page_pool_size 预先创建页面放入页面池"""
+        if self.page_pool_size <= 0:
+            return
+        self._page_pool = asyncio.Queue()
+        for _ in range(self.page_pool_size):
+            self._page_pool.put_nowait(await self._open_page())
+        logger.debug("页面池已就绪，页面数: %s", self.page_pool_size)
+    
+    @property
+    def context(self) -> Optional[BrowserContext]:
+        """兼容旧接口：连接到已有浏览器时沿用的上下文"""
+        return self._default_context
+        
+    def on_state(self, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """注册状态更新回调，返回用于取消注册的函数
+        
+        等价于订阅 state_stream，回调在发出状态更新时被直接调用。
+        """
+        return self.state_stream.subscribe(callback).dispose
+    
+    async def _connect_persistent_browser(self) -> Browser:
+        """连接常驻浏览器，锁文件不存在或已过期时启动一个新的
+        
+        锁文件中的进程号可能已被其他进程复用，浏览器也可能已不再监听，连接失败时同样重新启动。
+        启动过程持有文件锁，多个进程同时首次运行时只有一个会真正启动浏览器。
+        """
+        stale_endpoint = self._read_persistent_endpoint()
+        if stale_endpoint:
+            browser = await self._try_connect_over_cdp(stale_endpoint)
+            if browser is not None:
+                return browser
+        async with _persistent_launch_lock():
+            # 等待锁期间其他进程可能已经启动了常驻浏览器
+            endpoint = self._read_persistent_endpoint()
+            if endpoint and endpoint != stale_endpoint:
+                browser = await self._try_connect_over_cdp(endpoint)
+                if browser is not None:
+                    return browser
+            endpoint = await self._launch_persistent_browser()
+            logger.debug("连接到常驻浏览器: %s", endpoint)
+            return await self.playwright.chromium.connect_over_cdp(endpoint)
+    
+    async def _try_connect_over_cdp(self, endpoint: str) -> Optional[Browser]:
+        """连接锁文件中记录的CDP端点，失败时返回None"""
+        logger.debug("连接到常驻浏览器: %s", endpoint)
+        try:
+            return await self.playwright.chromium.connect_over_cdp(endpoint)
+        except Exception as e:
+            logger.warning("连接常驻浏览器失败，忽略过期的锁文件: %s", e)
+            return None
+    
+    @staticmethod
+    def _read_persistent_endpoint() -> Optional[str]:
+        """读取常驻浏览器锁文件，浏览器进程已退出时返回None
+        
+        进程是否存活只是粗略判断，无法判断时照常返回端点，由连接失败后的重新启动兜底。
+        """
+        try:
+            with open(PERSISTENT_ENDPOINT_FILE, 'r', encoding='utf-8') as f:
+                lock = json.load(f)
+            pid = lock["pid"]
+            endpoint = lock["endpoint"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if os.name == "nt":
+            # Windows上信号0是CTRL_C_EVENT，os.kill不能用来探测进程
+            return endpoint
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            logger.debug("常驻浏览器进程 %s 已退出，忽略过期的锁文件", pid)
+            return None
+        except OSError:
+            # PermissionError：进程存在但属于其他用户；其余错误无法判断，交给连接结果决定
+            pass
+        return endpoint
+    
+    async def _launch_persistent_browser(self, startup_timeout: float = 30) -> str:
+        """以独立进程组启动常驻浏览器，写入锁文件并返回其CDP端点
+        
+        浏览器不是Playwright驱动的子进程，当前进程退出后仍然存活，供后续运行复用。
+        调用方需持有 _persistent_launch_lock。
+        """
+        user_data_dir = PERSISTENT_BROWSER_DIR / "user-data"
+        user_data_dir.mkdir(parents=True, exist_ok=True)
+        # 浏览器启动后会把实际监听的端口写入该文件
+        port_file = user_data_dir / "DevToolsActivePort"
+        port_file.unlink(missing_ok=True)
+        
+        logger.debug("启动常驻Chrome浏览器实例")
+        process = subprocess.Popen(
+            [
+                self.playwright.chromium.executable_path,
+                "--remote-debugging-port=0",
+                f"--user-data-dir={user_data_dir}",
+                "--disable-blink-features=AutomationControlled",
+                "--no-first-run",
+                "--no-default-browser-check",
+                "about:blank",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + startup_timeout
+        while True:
+            lines = port_file.read_text(encoding='utf-8').splitlines() if port_file.exists() else []
+            if len(lines) >= 2:
+                break
+            if process.poll() is not None:
+                raise RuntimeError(f"常驻浏览器启动失败，退出码: {process.returncode}")
+            if loop.time() > deadline:
+                process.kill()
+                raise TimeoutError(f"常驻浏览器启动超时，超过{startup_timeout}秒")
+            await asyncio.sleep(0.1)
+        endpoint = f"ws://127.0.0.1:{lines[0]}{lines[1]}"
+        
+        tmp_file = PERSISTENT_ENDPOINT_FILE.with_suffix(".tmp")
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump({"pid": process.pid, "endpoint": endpoint}, f)
+        os.replace(tmp_file, PERSISTENT_ENDPOINT_FILE)
+        logger.debug("常驻浏览器启动成功，pid: %s", process.pid)
+        return endpoint
+    
     def create_dsl_executor(self, dsl_config: Dict) -> Observable:
         """基于DSL配置创建可观察执行流"""
-        logger.debug(f"创建DSL执行器，配置: {dsl_config.get('name', 'unnamed')}")
+        logger.debug("创建DSL执行器，配置: %s", dsl_config.get('name', 'unnamed'))
         # 确保浏览器已初始化
         if not self.browser:
             logger.error("创建执行器失败：浏览器未初始化")
             raise RuntimeError("Browser not initialized. Call initialize() first.")
         
-        return rx.create(lambda observer, scheduler: self._execute_dsl_pipeline(observer, dsl_config))
+        # 步骤配置只解析一次，每次订阅都复用解析结果
+        steps = tuple(self._compile_step(step, i) for i, step in enumerate(dsl_config["steps"]))
+        # 跳转时直接把目标序号作为下一个步骤下标，这里确保目标都在步骤列表范围内；
+        # 目标等于步骤数时表示跳到末尾，直接结束执行
+        for step in steps:
+            for _, goto_step in step.next_step_routes:
+                if type(goto_step) is not int or not 0 <= goto_step <= len(steps):
+                    raise ValueError(f"步骤 #{step.index} ({step.type}) 的跳转目标无效: {goto_step!r}")
+        
+        import rx
+        
+        return rx.create(partial(self._subscribe_pipeline, dsl_config=dsl_config, steps=steps))
     
-    async def _execute_dsl_pipeline(self, observer, dsl_config: Dict):
-        """执行DSL任务管道"""
+    def _compile_step(self, step: Dict, step_index: int) -> CompiledStep:
+        """解析步骤配置并生成该步骤专用的执行函数"""
+        compiled = compile_step(step, step_index, self._matcher_cache)
+        compiled.run = self._step_builders[compiled.type](step)
+        return compiled
+    
+    def _subscribe_pipeline(self, observer, scheduler=None, *,
+                            dsl_config: Dict, steps: Tuple[CompiledStep, ...]) -> Disposable:
+        """订阅时在事件循环中启动执行任务，取消订阅即取消该任务"""
+        from rx.disposable import Disposable
+        
+        task = self._loop.create_task(self._execute_dsl_pipeline(observer, dsl_config, steps))
+        return Disposable(task.cancel)
+    
+    async def _execute_dsl_pipeline(self, observer, dsl_config: Dict, steps: Tuple[CompiledStep, ...]):
+        """执行DSL任务管道
+        
+        每次执行使用独立的BrowserContext，cookie、localStorage等状态互不干扰，
+        多个playbook可以在同一个浏览器中并发执行；启用页面池时从池中取出预先创建的页面。
+        浏览器上下文在通知观察者之前释放，观察者收到完成通知后可以立即关闭框架。
+        """
         try:
-            page = await self.context.new_page()
-            self.current_context = ExecutionContext(
+            browser_context, page, owns_browser_context = await self._acquire_page()
+            execution_context = ExecutionContext(
                 page=page,
-                data=dsl_config.get("initial_data", {}),
-                state={"current_step": 0, "retry_count": 0}
+                # playbook配置可能来自共享缓存，复制一份避免执行过程中被修改
+                data=dict(dsl_config.get("initial_data", {})),
+                browser_context=browser_context,
+                owns_browser_context=owns_browser_context
             )
-            
-            # 创建主执行流
-            execution_flow = self._build_execution_flow(dsl_config["steps"])
-            
-            # 订阅执行流
-            subscription = execution_flow.subscribe(
-                on_next=lambda result: self._handle_step_result(result, observer),
-                on_error=lambda error: observer.on_error(error),
-                on_completed=lambda: observer.on_completed(),
-                scheduler=self.scheduler
-            )
-            
-            # 启动执行
-            await self._start_execution(execution_flow)
-            
+            try:
+                self.current_context = execution_context
+                self._active_contexts.add(execution_context)
+                await self._run_steps(execution_context, steps, observer)
+            finally:
+                self._active_contexts.discard(execution_context)
+                await self._release_execution_context(execution_context)
         except Exception as e:
-            observer.on_error(e)
+            try:
+                self._flush_state_updates()
+            finally:
+                observer.on_error(e)
+            return
+        # 无论剩余的状态更新能否发出，都要通知观察者，否则调用方会一直等到整体超时
+        try:
+            self._flush_state_updates()
+        finally:
+            observer.on_completed()
     
-    def _build_execution_flow(self, steps: List[Dict]) -> Observable:
-        """构建基于模式匹配的执行流"""
-        step_observables = []
-        
-        for i, step in enumerate(steps):
-            step_obs = self._create_step_observable(step, i)
-            step_observables.append(step_obs)
-        
-        # 使用 concat 按顺序执行，但允许基于模式匹配的动态路由
-        return Observable.concat(*step_observables).pipe(
-            ops.flat_map(lambda result: self._pattern_based_routing(result, steps))
-        )
+    async def _acquire_page(self) -> Tuple[BrowserContext, Page, bool]:
+        """取得本次执行使用的页面：启用页面池时从池中取出，取到占位时创建新页面"""
+        page_pool = self._page_pool
+        if page_pool is None:
+            return await self._open_page()
+        entry = await page_pool.get()
+        if entry is not None:
+            return entry
+        try:
+            return await self._open_page()
+        except Exception:
+            # 放回占位，避免页面池因创建失败而缩小
+            page_pool.put_nowait(None)
+            raise
     
-    def _create_step_observable(self, step: Dict, step_index: int) -> Observable:
-        """为每个步骤创建可观察对象，支持每个step自定义重试和超时设置
+    async def _open_page(self) -> Tuple[BrowserContext, Page, bool]:
+        """创建一个执行用的页面，返回 (浏览器上下文, 页面, 上下文是否由本框架创建)
         
-        支持不限超时的情况：当timeout设置为0或None时，表示不应用超时控制，
-        适用于需要等待任意长时间直到条件满足的场景，类似于Playwright的wait_for_selector无超时模式。
+        连接到已有浏览器时在其现有上下文中创建页面，其余情况每个页面使用独立的上下文。
         """
-        logger.debug(f"创建步骤可观察对象 #{step_index}: {step.get('type', 'unknown')}，名称: {step.get('name', 'unnamed')}")
-        # 从step配置中获取重试和超时参数，每个step可以完全自定义这些值
-        max_retries = step.get("max_retries", 3)  # 最大重试次数，默认3次
-        timeout = step.get("timeout", 30000)  # 超时时间，默认30秒，设置为0或None表示不限超时
-        
-        # 日志记录配置，特别标记不限超时的情况
-        timeout_info = "无超时限制" if timeout == 0 or timeout is None else f"{timeout}ms"
-        logger.debug(f"  步骤配置: max_retries={max_retries}, timeout={timeout_info}")
-        
-        # 创建一个包装器，在重试时更新状态
-        def execute_with_retry_state_update():
-            try:
-                return self._execute_single_step(step, step_index)
-            except Exception as e:
-                # 更新状态为失败
-                self._emit_state_update(step_index, TaskState.FAILED, str(e))
-                # 重新抛出异常以触发重试机制
-                raise
-        
-        # 创建步骤可观察对象
-        step_observable = Observable.defer(execute_with_retry_state_update)
+        owns_browser_context = self._default_context is None
+        if not owns_browser_context:
+            return self._default_context, await self._default_context.new_page(), False
+        browser_context = await self.browser.new_context()
+        try:
+            return browser_context, await browser_context.new_page(), True
+        except Exception:
+            await browser_context.close()
+            raise
+    
+    async def _release_execution_context(self, execution_context: ExecutionContext):
+        """释放本次执行的CDP会话；启用页面池时回收页面，否则关闭本次执行创建的页面
         
-        # 应用超时控制（仅当timeout不为0或None时）
-        if timeout != 0 and timeout is not None:
-            step_observable = step_observable.pipe(
-                ops.timeout(timeout)
-            )
+        上下文由本次执行创建时连同上下文一起关闭；连接到已有浏览器时只关闭本次执行打开的标签页。
+        """
+        await self._detach_cdp_session(execution_context)
+        if self._page_pool is not None:
+            await self._recycle_page(execution_context)
         else:
-            logger.debug(f"  步骤 #{step_index}: 已启用无超时限制模式")
-        
-        # 应用自定义重试机制（如果配置了重试）
-        if max_retries > 0:
-            # 使用RxPy的retry操作符并传入最大重试次数
-            step_observable = step_observable.pipe(
-                ops.retry(max_retries)
+            logger.debug("关闭执行上下文对应的页面")
+            await self._close_page(
+                execution_context.browser_context, execution_context.page, execution_context.owns_browser_context
             )
+    
+    async def _recycle_page(self, execution_context: ExecutionContext):
+        """把页面恢复到空白状态后放回页面池
         
-        # 添加状态更新监听器
-        step_observable = step_observable.pipe(
-            ops.do_action(
-                on_next=lambda result: self._emit_state_update(step_index, TaskState.RUNNING, result)
-            )
-        )
+        页面已不可用时关闭它并放回None占位，下次取出时再创建新页面；回收本身不会抛出异常，
+        也不会让页面池缩小，执行结果不受回收失败影响。回收期间框架被关闭时直接关闭页面。
+        """
+        # 回收过程中的await期间close()可能已经拆除页面池，先取得当前的页面池
+        page_pool = self._page_pool
+        browser_context = execution_context.browser_context
+        page = execution_context.page
+        owns_browser_context = execution_context.owns_browser_context
+        try:
+            await page.goto("about:blank")
+            # 已有浏览器的上下文属于用户，不清理其cookie
+            if owns_browser_context:
+                await browser_context.clear_cookies()
+            entry = (browser_context, page, owns_browser_context)
+        except Exception as e:
+            logger.warning("回收页面失败，下次使用时重新创建: %s", e)
+            await self._close_page(browser_context, page, owns_browser_context)
+            entry = None
+        if self._page_pool is not page_pool:
+            logger.debug("页面池已关闭，关闭回收的页面")
+            if entry is not None:
+                await self._close_page(*entry)
+            return
+        page_pool.put_nowait(entry)
+    
+    @staticmethod
+    async def _close_page(browser_context: BrowserContext, page: Page, owns_browser_context: bool):
+        """关闭页面；上下文由本框架创建时连同上下文一起关闭"""
+        try:
+            if owns_browser_context:
+                await browser_context.close()
+            else:
+                await page.close()
+        except Exception as e:
+            # 页面或浏览器已关闭
+            logger.debug("关闭页面失败: %s", e)
+    
+    async def _get_cdp_session(self, context: ExecutionContext) -> CDPSession:
+        """获取当前页面的CDP会话，每个页面只创建一次"""
+        if context.cdp_session is None:
+            context.cdp_session = await context.browser_context.new_cdp_session(context.page)
+        return context.cdp_session
+    
+    async def _detach_cdp_session(self, context: ExecutionContext):
+        """断开缓存的CDP会话"""
+        cdp_session = context.cdp_session
+        if cdp_session is None:
+            return
+        context.cdp_session = None
+        try:
+            await cdp_session.detach()
+        except Exception as e:
+            # 页面或浏览器已关闭时会话已随之失效
+            logger.debug("断开CDP会话失败: %s", e)
+    
+    async def _run_steps(self, context: ExecutionContext, steps: Tuple[CompiledStep, ...], observer):
+        """按顺序执行步骤，每个步骤的结果发给观察者
         
-        return step_observable
+        步骤命中跳转规则时从目标步骤继续执行，步骤序号始终是在完整步骤列表中的下标。
+        """
+        on_next = observer.on_next
+        step_index = 0
+        while step_index < len(steps):
+            step = steps[step_index]
+            result = await self._run_step_with_retry(context, step)
+            on_next(result)
+            step_index = await self._pattern_based_routing(result, step)
     
-    async def _execute_single_step(self, step: Dict, step_index: int) -> Dict[str, Any]:
-        """执行单个步骤"""
-        step_type = step["type"]
-        step_name = step.get("name", f"step_{step_index}")
-        logger.debug(f"执行步骤 #{step_index}: {step_type} (名称: {step_name})")
+    async def _run_step_with_retry(self, context: ExecutionContext, step: CompiledStep) -> Dict[str, Any]:
+        """执行步骤，失败时按步骤配置重试
         
-        context = self.current_context
+        max_retries 是包括首次执行在内的最多执行次数，小于1时只执行一次。
+        """
+        attempts = max(step.max_retries, 1)
+        context.retry_count = 0
+        for attempt in range(1, attempts + 1):
+            try:
+                return await self._execute_single_step(context, step)
+            except Exception:
+                if attempt == attempts:
+                    raise
+                context.retry_count = attempt
+                logger.debug("  步骤 #%s 第%s次重试", step.index, attempt)
+    
+    async def _execute_single_step(self, context: ExecutionContext, step: CompiledStep) -> Dict[str, Any]:
+        """在给定的执行上下文中执行单个步骤"""
+        step_index = step.index
+        logger.debug("执行步骤 #%s: %s (名称: %s)", step_index, step.type, step.name)
         
         self._emit_state_update(step_index, TaskState.RUNNING)
         
         try:
-            if step_type == "navigate":
-                url = step["url"]
-                logger.debug(f"  导航到: {url}")
-                await context.page.goto(url)
-                logger.debug(f"  导航成功")
-                result = {"type": "navigation", "url": url, "status": "success"}
-                
-            elif step_type == "click":
-                selector = step["selector"]
-                logger.debug(f"  点击元素: {selector}")
-                await context.page.click(selector)
-                logger.debug(f"  点击成功")
-                result = {"type": "click", "selector": selector, "status": "success"}
-                
-            elif step_type == "type":
-                selector = step["selector"]
-                text = step["text"]
-                logger.debug(f"  在元素 {selector} 中输入文本: {text[:20]}{'...' if len(text) > 20 else ''}")
-                await context.page.fill(selector, text)
-                logger.debug(f"  文本输入成功")
-                result = {"type": "type", "selector": selector, "text": text, "status": "success"}
-                
-            elif step_type == "wait_for_pattern":
-                pattern = step["pattern"]
-                logger.debug(f"  等待模式匹配: {pattern['type']} = {pattern['value']}")
-                match_result = await self._wait_for_pattern(pattern)
-                logger.debug(f"  模式匹配结果: {match_result['matched']}")
-                result = {"type": "pattern_match", "pattern": pattern, "match": match_result}
-                
-            elif step_type == "extract_data":
-                extraction_config = step["extract"]
-                logger.debug(f"  提取数据，配置项数量: {len(extraction_config)}")
-                extracted_data = await self._extract_data(extraction_config)
-                logger.debug(f"  数据提取成功，提取字段数: {len(extracted_data)}")
-                result = {"type": "extraction", "data": extracted_data}
-                
-            elif step_type == "conditional":
-                condition = step["condition"]
-                logger.debug(f"  评估条件: {condition['type']}")
-                condition_result = await self._evaluate_condition(condition)
-                logger.debug(f"  条件评估结果: {condition_result}")
-                result = {"type": "conditional", "condition": condition, "result": condition_result}
-                
-            elif step_type == "cdp_command":
-                command = step["command"]
-                params = step.get("params", {})
-                logger.debug(f"  执行CDP命令: {command}")
-                cdp_result = await self._execute_cdp_command(command, params)
-                logger.debug(f"  CDP命令执行成功")
-                result = {"type": "cdp", "command": command, "result": cdp_result}
-                
+            # 当timeout设置为0或None时不限超时，适用于需要等待任意长时间直到条件满足的场景；
+            # 自带超时的步骤类型未显式配置timeout时同样不套用超时，避免多余的定时器
+            if step.timeout_seconds is not None:
+                try:
+                    if _asyncio_timeout is not None:
+                        async with _asyncio_timeout(step.timeout_seconds):
+                            result = await step.run(context)
+                    else:
+                        result = await asyncio.wait_for(step.run(context), step.timeout_seconds)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"步骤 #{step_index} 执行超时，超过{step.timeout}ms") from None
             else:
-                raise ValueError(f"未知的步骤类型: {step_type}")
+                result = await step.run(context)
             
             # 更新上下文
             context.last_result = result
-            context.state["current_step"] = step_index
+            context.current_step = step_index
             
-            logger.debug(f"  步骤 #{step_index} 执行成功")
+            logger.debug("  步骤 #%s 执行成功", step_index)
             self._emit_state_update(step_index, TaskState.SUCCESS, result)
             return result
             
         except Exception as e:
-            logger.debug(f"  步骤 #{step_index} 执行失败: {str(e)}")
+            logger.debug("  步骤 #%s 执行失败: %s", step_index, e)
             self._emit_state_update(step_index, TaskState.FAILED, str(e))
             raise
     
-    def _pattern_based_routing(self, step_result: Dict, all_steps: List[Dict]) -> Observable:
-        """基于模式匹配的路由决策"""
-        current_step_index = self.current_context.state["current_step"]
-        current_step = all_steps[current_step_index]
+    # 以下 _build_* 方法在创建执行器时调用，把步骤参数绑定进闭包；
+    # 结果固定不变的步骤预先构造结果模板，每次执行返回其浅拷贝，观察者和状态订阅者修改结果不会影响其他执行
+    
+    def _build_navigate(self, step: Dict) -> Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]:
+        """navigate步骤：导航到指定URL"""
+        url = step["url"]
+        result = {"type": "navigation", "url": url, "status": "success"}
+        
+        async def run(context: ExecutionContext) -> Dict[str, Any]:
+            logger.debug("  导航到: %s", url)
+            await context.page.goto(url)
+            # 页面已切换，之前缓存的Locator不再对应当前页面的元素
+            context.locators.clear()
+            return dict(result)
+        return run
+    
+    def _build_click(self, step: Dict) -> Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]:
+        """click步骤：点击元素"""
+        selector = step["selector"]
+        result = {"type": "click", "selector": selector, "status": "success"}
+        
+        async def run(context: ExecutionContext) -> Dict[str, Any]:
+            logger.debug("  点击元素: %s", selector)
+            await context.locator(selector).click()
+            return dict(result)
+        return run
+    
+    def _build_type(self, step: Dict) -> Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]:
+        """type步骤：向元素输入文本"""
+        selector = step["selector"]
+        text = step["text"]
+        result = {"type": "type", "selector": selector, "text": text, "status": "success"}
+        # 日志中的文本预览只截断一次
+        preview = text[:20] + ('...' if len(text) > 20 else '')
+        
+        async def run(context: ExecutionContext) -> Dict[str, Any]:
+            logger.debug("  在元素 %s 中输入文本: %s", selector, preview)
+            await context.locator(selector).fill(text)
+            return dict(result)
+        return run
+    
+    def _build_wait_for_pattern(self, step: Dict) -> Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]:
+        """wait_for_pattern步骤：等待模式匹配"""
+        pattern = step["pattern"]
+        
+        async def run(context: ExecutionContext) -> Dict[str, Any]:
+            logger.debug("  等待模式匹配: %s = %s", pattern['type'], pattern['value'])
+            match_result = await self._wait_for_pattern(context, pattern)
+            return {"type": "pattern_match", "pattern": pattern, "match": match_result}
+        return run
+    
+    def _build_extract_data(self, step: Dict) -> Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]:
+        """extract_data步骤：提取页面数据"""
+        extraction_config = step["extract"]
+        # 按提取方式分组并生成合并提取脚本，每次执行只需传入选择器映射
+        selectors = {
+            key: config["selector"] for key, config in extraction_config.items()
+            if config["method"] == "selector_text"
+        }
+        expressions = {
+            key: config["expression"] for key, config in extraction_config.items()
+            if config["method"] == "evaluate_js"
+        }
+        script = self._build_batch_extract_script(expressions)
+        
+        async def run(context: ExecutionContext) -> Dict[str, Any]:
+            logger.debug("  提取数据，配置项数量: %s", len(extraction_config))
+            extracted_data = await self._extract_data(context, extraction_config, selectors, expressions, script)
+            return {"type": "extraction", "data": extracted_data}
+        return run
+    
+    def _build_conditional(self, step: Dict) -> Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]:
+        """conditional步骤：评估条件"""
+        condition = step["condition"]
+        
+        async def run(context: ExecutionContext) -> Dict[str, Any]:
+            logger.debug("  评估条件: %s", condition['type'])
+            condition_result = await self._evaluate_condition(context, condition)
+            return {"type": "conditional", "condition": condition, "result": condition_result}
+        return run
+    
+    def _build_cdp_command(self, step: Dict) -> Callable[[ExecutionContext], Awaitable[Dict[str, Any]]]:
+        """cdp_command步骤：执行CDP命令"""
+        command = step["command"]
+        params = step.get("params", {})
         
-        # 检查是否有基于模式匹配的下一步决策
-        if "next_step_patterns" in current_step:
-            for pattern_rule in current_step["next_step_patterns"]:
-                if self._matches_pattern(step_result, pattern_rule["pattern"]):
-                    target_step = pattern_rule["goto_step"]
-                    # 创建从目标步骤开始的新执行流
-                    remaining_steps = all_steps[target_step:]
-                    return self._build_execution_flow(remaining_steps)
+        async def run(context: ExecutionContext) -> Dict[str, Any]:
+            logger.debug("  执行CDP命令: %s", command)
+            cdp_result = await self._execute_cdp_command(context, command, params)
+            return {"type": "cdp", "command": command, "result": cdp_result}
+        return run
+    
+    async def _pattern_based_routing(self, step_result: Dict, step: CompiledStep) -> int:
+        """基于模式匹配的路由决策，返回下一个要执行的步骤序号
         
+        对较大的结果做深度模式匹配会长时间占用事件循环，因此包含data规则时匹配在线程池中进行；
+        只比较结果类型的规则开销远小于线程切换，直接在事件循环中匹配。
+        """
         # 默认继续下一个步骤
-        return Observable.just(step_result)
+        if not step.next_step_routes:
+            return step.index + 1
+        
+        if step.routes_match_data:
+            if self._cpu_executor is None:
+                self._cpu_executor = ThreadPoolExecutor(max_workers=2)
+            target = await self._loop.run_in_executor(self._cpu_executor, self._match_next_step, step_result, step)
+        else:
+            target = self._match_next_step(step_result, step)
+        return step.index + 1 if target is None else target
+    
+    def _match_next_step(self, step_result: Dict, step: CompiledStep) -> Optional[int]:
+        """按顺序检查步骤的跳转规则，返回第一个命中规则的目标步骤"""
+        for matches, goto_step in step.next_step_routes:
+            if matches(step_result):
+                return goto_step
+        return None
     
-    async def _wait_for_pattern(self, pattern_config: Dict) -> Dict[str, Any]:
-        """等待模式匹配"""
+    async def _wait_for_pattern(self, context: ExecutionContext, pattern_config: Dict) -> Dict[str, Any]:
+        """等待模式匹配，按模式类型分发到对应的等待函数"""
         pattern_type = pattern_config["type"]
-        pattern_value = pattern_config["value"]
-        timeout = pattern_config.get("timeout", 5000)
+        waiter = self._pattern_waiters.get(pattern_type)
+        if waiter is None:
+            raise ValueError(f"未知的模式类型: {pattern_type}")
+        return await waiter(context, pattern_config, pattern_config.get("timeout", 5000))
+    
+    async def _wait_for_url_pattern(self, context: ExecutionContext, pattern_config: Dict,
+                                    timeout: int) -> Dict[str, Any]:
+        """等待URL匹配正则表达式
         
-        context = self.current_context
+        直接把编译好的正则交给 wait_for_url，由Playwright根据导航事件匹配，页面中不做轮询；
+        URL一变化即匹配，不等待页面加载完成。
+        """
+        regex = _compile(pattern_config["value"])
+        await context.page.wait_for_url(regex, timeout=timeout, wait_until="commit")
+        current_url = context.page.url
+        return {"type": "url", "matched": bool(regex.search(current_url)), "url": current_url}
+    
+    async def _wait_for_content_pattern(self, context: ExecutionContext, pattern_config: Dict,
+                                        timeout: int) -> Dict[str, Any]:
+        """等待页面内容包含特定文本"""
+        pattern_value = pattern_config["value"]
+        try:
+            await context.page.wait_for_selector(f"text={pattern_value}", timeout=timeout)
+            return {"type": "content", "matched": True, "content": pattern_value}
+        except Exception:
+            return {"type": "content", "matched": False, "content": pattern_value}
+    
+    async def _wait_for_element_pattern(self, context: ExecutionContext, pattern_config: Dict,
+                                        timeout: int) -> Dict[str, Any]:
+        """等待元素出现"""
+        pattern_value = pattern_config["value"]
+        try:
+            await context.page.wait_for_selector(pattern_value, timeout=timeout)
+            return {"type": "element", "matched": True, "selector": pattern_value}
+        except Exception:
+            return {"type": "element", "matched": False, "selector": pattern_value}
+    
+    async def _wait_for_custom_pattern(self, context: ExecutionContext, pattern_config: Dict,
+                                       timeout: int) -> Dict[str, Any]:
+        """自定义模式匹配函数"""
+        custom_check = pattern_config["check_function"]
+        result = await custom_check(context)
+        return {"type": "custom", "matched": result}
+    
+    async def _extract_data(self, context: ExecutionContext, extraction_config: Dict, selectors: Dict[str, str],
+                            expressions: Dict[str, str], script: str) -> Dict[str, Any]:
+        """提取数据
         
-        if pattern_type == "url":
-            # 等待URL匹配正则表达式
-            await context.page.wait_for_function(
-                f"window.location.href.match(/{pattern_value}/)",
-                timeout=timeout
-            )
-            current_url = context.page.url
-            return {"type": "url", "matched": bool(re.search(pattern_value, current_url)), "url": current_url}
-            
-        elif pattern_type == "content":
-            # 等待页面内容包含特定文本
-            try:
-                await context.page.wait_for_selector(
-                    f"text={pattern_value}",
-                    timeout=timeout
-                )
-                return {"type": "content", "matched": True, "content": pattern_value}
-            except:
-                return {"type": "content", "matched": False, "content": pattern_value}
-                
-        elif pattern_type == "element":
-            # 等待元素出现
-            try:
-                element = await context.page.wait_for_selector(pattern_value, timeout=timeout)
-                return {"type": "element", "matched": True, "selector": pattern_value}
-            except:
-                return {"type": "element", "matched": False, "selector": pattern_value}
-        
-        elif pattern_type == "custom":
-            # 自定义模式匹配函数
-            custom_check = pattern_config["check_function"]
-            result = await custom_check(context)
-            return {"type": "custom", "matched": result}
-    
-    async def _extract_data(self, extraction_config: Dict) -> Dict[str, Any]:
-        """提取数据"""
-        context = self.current_context
-        extracted = {}
+        selector_text 和 evaluate_js 类型的配置项合并为一次 page.evaluate 调用，
+        N个配置项只需一次CDP往返；cdp 类型的配置项复用页面的CDP会话。
+        各配置项之间没有依赖，合并脚本、page_content 和 cdp 调用并发执行。
+        selectors、expressions 和合并脚本 script 在创建执行器时按配置生成。
+        """
+        # 键为None的位置是合并脚本的结果，其余为单个配置项的结果
+        keys = []
+        pending = []
+        if selectors or expressions:
+            keys.append(None)
+            pending.append(self._evaluate_extract_batch(context, selectors, expressions, script))
         
+        cdp_session = None
         for key, config in extraction_config.items():
-            if config["method"] == "selector_text":
-                element = await context.page.query_selector(config["selector"])
-                extracted[key] = await element.text_content() if element else None
-            elif config["method"] == "page_content":
-                extracted[key] = await context.page.content()
-            elif config["method"] == "evaluate_js":
-                extracted[key] = await context.page.evaluate(config["expression"])
-            elif config["method"] == "cdp":
-                cdp_session = await context.context.new_cdp_session(context.page)
-                result = await cdp_session.send(config["command"], config.get("params", {}))
-                extracted[key] = result
+            method = config["method"]
+            if method == "page_content":
+                keys.append(key)
+                pending.append(context.page.content())
+            elif method == "cdp":
+                if cdp_session is None:
+                    # 在并发之前创建会话，避免多个配置项各自创建
+                    cdp_session = await self._get_cdp_session(context)
+                keys.append(key)
+                pending.append(cdp_session.send(config["command"], config.get("params", {})))
+        
+        extracted = {}
+        for key, value in zip(keys, await asyncio.gather(*pending), strict=True):
+            if key is None:
+                extracted.update(value)
+            else:
+                extracted[key] = value
         
+        # 保持与配置项一致的键顺序
+        return {key: extracted[key] for key in extraction_config if key in extracted}
+    
+    async def _evaluate_extract_batch(self, context: ExecutionContext, selectors: Dict[str, str],
+                                      expressions: Dict[str, str], script: str) -> Dict[str, Any]:
+        """执行合并提取脚本，返回 selector_text 和 evaluate_js 配置项的结果"""
+        try:
+            return await context.page.evaluate(script, selectors)
+        except Exception as e:
+            # 表达式不是单个JS表达式（例如包含多条语句）时无法合并，选择器仍一次读取，表达式逐项执行
+            if not expressions or "SyntaxError" not in str(e):
+                raise
+            logger.debug("合并提取脚本存在语法错误，回退为逐项执行表达式")
+        extracted = {}
+        if selectors:
+            extracted.update(await context.page.evaluate(_SELECTOR_TEXT_SCRIPT, selectors))
+        values = await asyncio.gather(*(context.page.evaluate(expression) for expression in expressions.values()))
+        extracted.update(zip(expressions, values, strict=True))
         return extracted
     
-    async def _evaluate_condition(self, condition_config: Dict) -> bool:
-        """评估条件"""
-        context = self.current_context
+    @staticmethod
+    def _build_batch_extract_script(expressions: Dict[str, str]) -> str:
+        """生成一次性提取多个配置项的JS函数，参数为 {配置项: 选择器} 映射
         
+        与 page.evaluate 的行为保持一致：表达式的值为函数时调用它，为Promise时等待其结果。
+        辅助变量使用双下划线前缀，避免遮蔽表达式中引用的页面全局变量。
+        """
+        if not expressions:
+            return _SELECTOR_TEXT_SCRIPT
+        lines = [
+            "async (__selectors) => {",
+            f"const __out = ({_SELECTOR_TEXT_SCRIPT})(__selectors);",
+            "const __value = v => typeof v === 'function' ? v() : v;",
+        ]
+        for key, expression in expressions.items():
+            # 换行用于隔离表达式末尾可能存在的单行注释
+            lines.append(f"__out[{json.dumps(key)}] = await __value(({expression.strip().rstrip(';')}\n));")
+        lines.append("return __out;")
+        lines.append("}")
+        return "\n".join(lines)
+    
+    async def _evaluate_condition(self, context: ExecutionContext, condition_config: Dict) -> bool:
+        """评估条件"""
         if condition_config["type"] == "pattern_match":
-            pattern_result = await self._wait_for_pattern(condition_config["pattern"])
+            pattern_result = await self._wait_for_pattern(context, condition_config["pattern"])
             return pattern_result["matched"]
         elif condition_config["type"] == "data_check":
             # 检查之前提取的数据
@@ -358,51 +1036,65 @@ class ReactiveAutomationFramework:
             actual_value = context.data.get(target_data)
             return actual_value == expected_value
     
-    async def _execute_cdp_command(self, command: str, params: Dict) -> Any:
+    async def _execute_cdp_command(self, context: ExecutionContext, command: str, params: Dict) -> Any:
         """执行CDP命令"""
-        context = self.current_context
-        cdp_session = await context.context.new_cdp_session(context.page)
+        cdp_session = await self._get_cdp_session(context)
         return await cdp_session.send(command, params)
     
-    def _matches_pattern(self, result: Dict, pattern: Dict) -> bool:
-        """检查结果是否匹配模式"""
-        if pattern["field"] == "type" and result.get("type") == pattern["value"]:
-            return True
-        elif pattern["field"] == "data" and result.get("data"):
-            # 实现更复杂的数据模式匹配
-            return self._deep_pattern_match(result["data"], pattern["value"])
-        return False
-    
-    def _deep_pattern_match(self, data: Any, pattern: Any) -> bool:
-        """深度模式匹配"""
-        if isinstance(pattern, dict) and isinstance(data, dict):
-            return all(self._deep_pattern_match(data.get(k), v) for k, v in pattern.items())
-        elif isinstance(pattern, list) and isinstance(data, list):
-            return all(any(self._deep_pattern_match(d, p) for d in data) for p in pattern)
-        else:
-            return data == pattern
-    
     def _emit_state_update(self, step_index: int, state: TaskState, result: Any = None):
-        """发射状态更新事件"""
+        """发射状态更新事件
+        
+        state 以字符串值发出，更新可以直接用 framework.dumps 序列化。
+        没有订阅者时不构造状态更新。更新先放入缓冲区，在下一轮事件循环中批量发出，
+        执行结束通知观察者之前以及关闭框架时也会发出剩余的更新。
+        """
+        logger.debug("状态更新: 步骤 #%s -> %s", step_index, state.name)
+        if not self.state_stream:
+            return
         update = {
             "step_index": step_index,
-            "state": state,
+            "state": state.value,
             "result": result,
-            "timestamp": asyncio.get_event_loop().time()
+            "timestamp": self._loop.time()
         }
-        logger.debug(f"状态更新: 步骤 #{step_index} -> {state.name}")
-        self.state_stream.on_next(update)
+        buffer = self._state_buffer
+        buffer.append(update)
+        if len(buffer) >= _STATE_BUFFER_SIZE:
+            self._flush_state_updates()
+        elif not self._state_flush_scheduled:
+            self._state_flush_scheduled = True
+            self._loop.call_soon(self._flush_state_updates)
     
-    async def _start_execution(self, execution_flow: Observable):
-        """启动执行流"""
-        # 这里可以添加更复杂的启动逻辑
-        pass
+    def _flush_state_updates(self):
+        """按顺序发出缓冲的状态更新"""
+        self._state_flush_scheduled = False
+        buffer = self._state_buffer
+        if not buffer:
+            return
+        self._state_buffer = []
+        on_next = self.state_stream.on_next
+        for update in buffer:
+            on_next(update)
     
     async def close(self):
         """关闭框架"""
         logger.debug("开始关闭框架...")
+        self._flush_state_updates()
+        for execution_context in list(self._active_contexts):
+            await self._detach_cdp_session(execution_context)
+        if self._cpu_executor is not None:
+            self._cpu_executor.shutdown(wait=False)
+            self._cpu_executor = None
+        if self._page_pool is not None:
+            while not self._page_pool.empty():
+                entry = self._page_pool.get_nowait()
+                if entry is not None:
+                    await self._close_page(*entry)
+            self._page_pool = None
         if self.browser:
             logger.debug("关闭浏览器...")
+            # 通过CDP连接的浏览器（包括常驻浏览器）调用close只会断开连接并关闭本框架创建的上下文，
+            # 浏览器进程本身保持运行
             await self.browser.close()
             logger.debug("浏览器已关闭")
         if self.playwright:
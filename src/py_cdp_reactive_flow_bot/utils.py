@@ -1,4 +1,131 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 # @time    : 2024/8/21 16:32
-# @author  : timger/yishenggudou
\ No newline at end of file
+# @author  : timger/yishenggudou
+from itertools import count
+from typing import Any, Callable, Iterator, List
+
+
+def deep_pattern_match(data: Any, pattern: Any) -> bool:
+    """深度模式匹配：字典按键递归匹配，列表要求每个模式项都能在数据列表中找到匹配项
+
+    使用显式工作栈代替递归，相等的子树直接跳过；
+    列表模式中的标量项通过对数据列表建一次集合后做成员判断，避免逐项比较。
+    模式来自YAML/JSON，按精确类型区分字典、列表和标量，标量模式只做一次相等比较。
+    """
+    stack = [(data, pattern)]
+    pop = stack.pop
+    while stack:
+        d, p = pop()
+        tp = type(p)
+        if tp is not dict and tp is not list:
+            if d is p or d == p:
+                continue
+            return False
+        if d == p:
+            continue
+        if tp is dict:
+            if not isinstance(d, dict):
+                return False
+            stack.extend((d.get(k), v) for k, v in p.items())
+        elif isinstance(d, list):
+            members = None
+            for item in p:
+                if type(item) is dict or type(item) is list:
+                    # 嵌套模式需要在数据列表中任意一项匹配即可
+                    if not any(deep_pattern_match(di, item) for di in d):
+                        return False
+                    continue
+                if members is None:
+                    members = _hashable_members(d)
+                try:
+                    found = item in members
+                except TypeError:
+                    found = any(di == item for di in d)
+                if not found:
+                    return False
+        else:
+            return False
+    return True
+
+
+def compile_pattern(pattern: Any) -> Callable[[Any], bool]:
+    """把模式预先展开为匹配函数，匹配语义与 deep_pattern_match 一致
+
+    模式在加载playbook时就已确定，只有数据在变化。字典和标量模式生成为一个Python函数的源码，
+    每个节点展开成一个条件表达式，匹配时不再对模式做类型判断和遍历；
+    列表模式需要在数据中查找匹配项，生成为闭包供生成的代码调用。
+    嵌套过深无法生成代码时回退到 deep_pattern_match。
+    """
+    if type(pattern) is list:
+        return _compile_list_pattern(pattern)
+    namespace = {}
+    try:
+        expression = _pattern_expression("data", pattern, namespace, count())
+        exec(compile(f"def match(data):\n    return {expression}\n", "<pattern>", "exec"), namespace)
+    except (SyntaxError, RecursionError, MemoryError):
+        return lambda data: deep_pattern_match(data, pattern)
+    return namespace["match"]
+
+
+def _pattern_expression(value: str, pattern: Any, namespace: dict, ids: Iterator[int]) -> str:
+    """生成判断 value 是否匹配 pattern 的表达式源码，value 在表达式中只求值一次
+
+    键、常量和列表匹配函数都放在 namespace 中按名字引用，不把模式内容拼接进源码；
+    ids 为生成的常量名和局部变量名提供编号。
+    """
+    def bind(obj: Any) -> str:
+        name = f"_c{next(ids)}"
+        namespace[name] = obj
+        return name
+
+    def new_var() -> str:
+        return f"_v{next(ids)}"
+
+    tp = type(pattern)
+    if tp is dict:
+        var = new_var()
+        parts = [f"isinstance(({var} := {value}), dict)"]
+        for key, child in pattern.items():
+            parts.append(_pattern_expression(f"{var}.get({bind(key)})", child, namespace, ids))
+        return f"({' and '.join(parts)})"
+    if tp is list:
+        return f"{bind(_compile_list_pattern(pattern))}({value})"
+    var = new_var()
+    constant = bind(pattern)
+    return f"(({var} := {value}) is {constant} or {var} == {constant})"
+
+
+def _compile_list_pattern(pattern: List[Any]) -> Callable[[Any], bool]:
+    """列表模式的匹配函数：嵌套模式需要在数据列表中任意一项匹配即可，标量模式做成员判断"""
+    nested = tuple(compile_pattern(item) for item in pattern if type(item) is dict or type(item) is list)
+    scalars = tuple(item for item in pattern if type(item) is not dict and type(item) is not list)
+
+    def match_list(data: Any) -> bool:
+        if not isinstance(data, list):
+            return False
+        for child in nested:
+            if not any(child(item) for item in data):
+                return False
+        if scalars:
+            members = _hashable_members(data)
+            for item in scalars:
+                try:
+                    found = item in members
+                except TypeError:
+                    found = any(di == item for di in data)
+                if not found:
+                    return False
+        return True
+    return match_list
+
+
+def _hashable_members(items: List[Any]) -> set:
+    """收集列表中可哈希的元素，用于标量模式的成员判断"""
+    members = set()
+    for item in items:
+        try:
+            members.add(item)
+        except TypeError:
+            pass
+    return members
@@ -1,5 +1,4 @@
 import asyncio
-import time
 from typing import Dict, Any
 
 # 直接模拟engine.py中的关键部分进行测试
@@ -38,14 +37,15 @@ class MockReactiveFramework:
         # 这个函数模拟Observable的行为
         async def execute_with_retry():
             retries = 0
-            start_time = time.time()
+            # 截止时间只计算一次，使用事件循环的单调时钟
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout / 1000
             
             while True:
                 try:
                     # 检查超时
-                    elapsed = (time.time() - start_time) * 1000  # 转换为毫秒
-                    if elapsed > timeout:
-                        raise asyncio.TimeoutError(f"执行超时: {elapsed:.2f}ms > {timeout}ms")
+                    if loop.time() > deadline:
+                        raise asyncio.TimeoutError(f"执行超时: 超过{timeout}ms")
                     
                     # 执行步骤
                     result = await self._execute_single_step(step, step_index)
@@ -0,0 +1,92 @@
+import pytest
+
+from py_cdp_reactive_flow_bot.engine import CompiledStep, _LRUCache, compile_result_matcher, compile_step
+
+
+def test_compile_step_applies_defaults():
+    """未配置重试和超时的步骤使用默认值"""
+    step = {"type": "navigate", "url": "https://example.com"}
+    compiled = compile_step(step, 2)
+    assert isinstance(compiled, CompiledStep)
+    assert compiled.index == 2
+    assert compiled.name == "step_2"
+    # 导航自带Playwright超时，不再套用步骤级超时
+    assert compiled.timeout is None
+    assert compiled.max_retries == 3
+    assert compiled.payload is step
+    assert compiled.next_step_patterns == ()
+
+
+def test_compile_step_default_timeout_for_untimed_steps():
+    """没有自带超时的步骤类型默认使用30秒步骤级超时"""
+    compiled = compile_step({"type": "cdp_command", "command": "Page.reload"}, 0)
+    assert compiled.timeout == 30000
+    assert compiled.timeout_seconds == 30
+
+
+def test_compile_step_keeps_custom_settings():
+    """自定义的重试、超时和跳转规则原样保留"""
+    rule = {"pattern": {"field": "type", "value": "click"}, "goto_step": 0}
+    compiled = compile_step(
+        {
+            "type": "click",
+            "selector": "#su",
+            "name": "点击",
+            "timeout": 0,
+            "max_retries": 1,
+            "next_step_patterns": [rule],
+        },
+        0,
+    )
+    assert compiled.name == "点击"
+    assert compiled.timeout == 0
+    assert compiled.timeout_seconds is None
+    assert compiled.max_retries == 1
+    assert compiled.next_step_patterns == (rule,)
+    (matches, goto_step), = compiled.next_step_routes
+    assert goto_step == 0
+    assert matches({"type": "click"}) and not matches({"type": "type"})
+    assert not compiled.routes_match_data
+
+
+@pytest.mark.parametrize(
+    "step, message",
+    [
+        ({"type": "teleport"}, "未知的步骤类型"),
+        ({"type": "type", "selector": "#kw"}, "缺少字段: text"),
+        ({"type": "wait_for_pattern", "pattern": {"type": "url", "value": "(unclosed"}}, "URL模式无效"),
+        ({"type": "navigate", "url": "https://example.com", "next_step_patterns": [{"goto_step": 1}]}, "跳转规则无效"),
+    ],
+)
+def test_compile_step_rejects_invalid_steps(step, message):
+    """未知的步骤类型和缺少必填字段在解析阶段报错"""
+    with pytest.raises(ValueError, match=message):
+        compile_step(step, 0)
+
+
+def test_compile_step_reuses_cached_matchers():
+    """同一个跳转模式对象只编译一次"""
+    rule = {"pattern": {"field": "data", "value": {"ok": True}}, "goto_step": 0}
+    step = {"type": "click", "selector": "#su", "next_step_patterns": [rule]}
+    cache = {}
+    first = compile_step(step, 0, cache).next_step_routes[0][0]
+    assert compile_step(step, 0, cache).next_step_routes[0][0] is first
+    # 内容相同的另一个模式对象重新编译
+    other = {"type": "click", "selector": "#su", "next_step_patterns": [{**rule, "pattern": dict(rule["pattern"])}]}
+    assert compile_step(other, 0, cache).next_step_routes[0][0] is not first
+    assert first({"data": {"ok": True}})
+    assert compile_step(step, 0).routes_match_data
+
+
+def test_matcher_cache_evicts_least_recently_used():
+    """跳转模式缓存容量有限，超出后淘汰最久未使用的模式"""
+    cache = _LRUCache(2)
+    patterns = [{"field": "type", "value": str(i)} for i in range(3)]
+    first = compile_result_matcher(patterns[0], cache)
+    compile_result_matcher(patterns[1], cache)
+    # 访问过的模式移到最近使用的位置
+    assert compile_result_matcher(patterns[0], cache) is first
+    compile_result_matcher(patterns[2], cache)
+    assert len(cache) == 2
+    assert id(patterns[1]) not in cache
+    assert compile_result_matcher(patterns[0], cache) is first
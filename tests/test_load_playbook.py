@@ -0,0 +1,114 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+import yaml
+
+from py_cdp_reactive_flow_bot import cli
+from py_cdp_reactive_flow_bot.cli import _load_playbook_cached, load_playbook
+
+PLAYBOOK_YAML = """\
+name: "缓存测试"
+timeout: 60
+steps:
+  - name: "导航"
+    type: "navigate"
+    url: "https://example.com"
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_playbook_cache():
+    """每个用例前清空进程内缓存，确保测试互不影响"""
+    _load_playbook_cached.cache_clear()
+    yield
+    _load_playbook_cached.cache_clear()
+
+
+def write_playbook(tmp_path: Path, content: str = PLAYBOOK_YAML) -> Path:
+    playbook_path = tmp_path / "playbook.yml"
+    playbook_path.write_text(content, encoding="utf-8")
+    return playbook_path
+
+
+def test_load_playbook_writes_json_sidecar(tmp_path):
+    """首次加载后应在同目录生成JSON旁路缓存，再次加载直接命中缓存"""
+    playbook_path = write_playbook(tmp_path)
+    config = load_playbook(playbook_path)
+    assert config["name"] == "缓存测试"
+
+    cache_path = tmp_path / "playbook.cache.json"
+    assert cache_path.exists(), "未生成JSON缓存文件"
+    cached = json.loads(cache_path.read_text(encoding="utf-8"))
+    assert cached["data"] == config
+
+    # 篡改缓存内容，确认第二次加载读取的是缓存而非YAML
+    cached["data"]["name"] = "来自缓存"
+    cache_path.write_text(json.dumps(cached), encoding="utf-8")
+    _load_playbook_cached.cache_clear()
+    assert load_playbook(playbook_path)["name"] == "来自缓存"
+
+
+def test_load_playbook_memoizes_in_process(tmp_path):
+    """同一文件未修改时重复加载返回同一个对象"""
+    playbook_path = write_playbook(tmp_path)
+    assert load_playbook(playbook_path) is load_playbook(playbook_path)
+
+
+def test_load_playbook_invalidates_cache_on_change(tmp_path):
+    """源文件修改后缓存失效，重新解析YAML"""
+    playbook_path = write_playbook(tmp_path)
+    load_playbook(playbook_path)
+
+    write_playbook(tmp_path, PLAYBOOK_YAML.replace("缓存测试", "已修改"))
+    stat = playbook_path.stat()
+    os.utime(playbook_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert load_playbook(playbook_path)["name"] == "已修改"
+
+
+def test_load_playbook_no_cache(tmp_path):
+    """禁用缓存时不生成旁路文件"""
+    playbook_path = write_playbook(tmp_path)
+    assert load_playbook(playbook_path, use_cache=False)["name"] == "缓存测试"
+    assert not (tmp_path / "playbook.cache.json").exists()
+
+
+def test_load_playbook_skips_lossy_cache(tmp_path):
+    """包含非字符串键的playbook无法无损转换为JSON，不应写入缓存"""
+    playbook_path = write_playbook(tmp_path, PLAYBOOK_YAML + "labels:\n  1: one\n")
+    config = load_playbook(playbook_path)
+    assert config["labels"] == {1: "one"}
+    assert not (tmp_path / "playbook.cache.json").exists()
+
+
+def test_load_playbook_rejects_invalid_url_pattern(tmp_path):
+    """url模式中的无效正则表达式应在加载阶段报错"""
+    playbook_path = write_playbook(
+        tmp_path,
+        PLAYBOOK_YAML
+        + '  - name: "等待跳转"\n'
+        + '    type: "wait_for_pattern"\n'
+        + "    pattern:\n"
+        + '      type: "url"\n'
+        + '      value: "(unclosed"\n',
+    )
+    with pytest.raises(ValueError, match="步骤 #1"):
+        load_playbook(playbook_path)
+
+
+
+def test_large_playbook_is_served_from_json_sidecar(tmp_path, monkeypatch):
+    """大文件同样整体解析并写入JSON旁路缓存，之后的进程直接读取缓存"""
+    step = '  - name: "步骤{i}"\n    type: "click"\n    selector: "#item-{i}"\n    max_retries: 1\n'
+    content = 'name: "大型playbook"\nsteps:\n' + "".join(step.format(i=i) for i in range(2000)) + "timeout: 30\n"
+    playbook_path = write_playbook(tmp_path, content)
+
+    config = load_playbook(playbook_path)
+    assert config == yaml.safe_load(content)
+    assert (tmp_path / "playbook.cache.json").exists()
+
+    # 模拟新进程：清空进程内缓存后应从旁路缓存加载，不再解析YAML
+    _load_playbook_cached.cache_clear()
+    monkeypatch.setattr(cli, "_parse_playbook", lambda path: pytest.fail("未命中旁路缓存"))
+    assert load_playbook(playbook_path) == config
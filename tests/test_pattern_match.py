@@ -0,0 +1,29 @@
+import pytest
+
+from py_cdp_reactive_flow_bot.utils import compile_pattern, deep_pattern_match
+
+
+@pytest.mark.parametrize(
+    "data, pattern, expected",
+    [
+        ({"a": 1, "b": 2}, {"a": 1}, True),
+        ({"a": 1}, {"a": 2}, False),
+        ({"a": {"b": {"c": 3}}}, {"a": {"b": {"c": 3}}}, True),
+        ({"a": {"b": {"c": 3, "d": 4}}}, {"a": {"b": {"d": 4}}}, True),
+        ({"a": {"b": 1}}, {"a": {"b": 1, "c": None}}, True),
+        ({"a": {"b": 1}}, {"a": {"c": 2}}, False),
+        ({"items": [1, 2, 3]}, {"items": [3, 1]}, True),
+        ({"items": [1, 2, 3]}, {"items": [4]}, False),
+        ({"items": [{"id": 1, "ok": True}, {"id": 2}]}, {"items": [{"ok": True}]}, True),
+        ({"items": [{"id": 1}, {"id": 2}]}, {"items": [{"id": 3}]}, False),
+        ({"items": [[1, 2], "x"]}, {"items": ["x", [2]]}, True),
+        ({"items": "not a list"}, {"items": ["x"]}, False),
+        ("scalar", "scalar", True),
+        ({"a": 1}, [1], False),
+    ],
+)
+def test_deep_pattern_match(data, pattern, expected):
+    """深度模式匹配：字典按键递归匹配，列表要求每个模式项都能在数据中找到"""
+    assert deep_pattern_match(data, pattern) is expected
+    # 预编译的匹配函数与直接匹配结果一致
+    assert compile_pattern(pattern)(data) is expected
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from py_cdp_reactive_flow_bot import engine
+from py_cdp_reactive_flow_bot.engine import ReactiveAutomationFramework
+
+
+@pytest.fixture(autouse=True)
+def persistent_dir(tmp_path, monkeypatch):
+    """把常驻浏览器的数据目录和锁文件指向临时目录"""
+    monkeypatch.setattr(engine, "PERSISTENT_BROWSER_DIR", tmp_path)
+    monkeypatch.setattr(engine, "PERSISTENT_ENDPOINT_FILE", tmp_path / "endpoint")
+    monkeypatch.setattr(engine, "PERSISTENT_LAUNCH_LOCK_FILE", tmp_path / "launch.lock")
+    return tmp_path
+
+
+def write_endpoint(pid, endpoint):
+    engine.PERSISTENT_ENDPOINT_FILE.write_text(json.dumps({"pid": pid, "endpoint": endpoint}), encoding="utf-8")
+
+
+def test_read_endpoint_of_running_browser():
+    write_endpoint(os.getpid(), "ws://127.0.0.1:9222/devtools/browser/a")
+    assert ReactiveAutomationFramework._read_persistent_endpoint() == "ws://127.0.0.1:9222/devtools/browser/a"
+
+
+@pytest.mark.parametrize("content", [None, "not json", "[]", '{"pid": 1}'])
+def test_read_endpoint_ignores_missing_or_invalid_lockfile(content):
+    if content is not None:
+        engine.PERSISTENT_ENDPOINT_FILE.write_text(content, encoding="utf-8")
+    assert ReactiveAutomationFramework._read_persistent_endpoint() is None
+
+
+def test_read_endpoint_ignores_exited_browser():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    write_endpoint(process.pid, "ws://127.0.0.1:9222/devtools/browser/a")
+    assert ReactiveAutomationFramework._read_persistent_endpoint() is None
+
+
+class FakeChromium:
+    def __init__(self, listening):
+        self.listening = listening
+        self.connected = []
+
+    async def connect_over_cdp(self, endpoint):
+        await asyncio.sleep(0)
+        if endpoint not in self.listening:
+            raise ConnectionRefusedError(endpoint)
+        self.connected.append(endpoint)
+        return endpoint
+
+
+class FakePlaywright:
+    def __init__(self, chromium):
+        self.chromium = chromium
+
+
+def make_framework(chromium, launches):
+    framework = ReactiveAutomationFramework()
+    framework.playwright = FakePlaywright(chromium)
+
+    async def launch():
+        # 模拟启动耗时，期间其他进程在等待启动锁
+        await asyncio.sleep(0.05)
+        endpoint = f"ws://127.0.0.1:9222/devtools/browser/{len(launches)}"
+        launches.append(endpoint)
+        chromium.listening.add(endpoint)
+        write_endpoint(os.getpid(), endpoint)
+        return endpoint
+
+    framework._launch_persistent_browser = launch
+    return framework
+
+
+def test_stale_endpoint_relaunches_browser():
+    """锁文件中的进程仍存在但浏览器不再监听时重新启动"""
+    write_endpoint(os.getpid(), "ws://127.0.0.1:9222/devtools/browser/stale")
+    chromium, launches = FakeChromium(set()), []
+    framework = make_framework(chromium, launches)
+    browser = asyncio.run(framework._connect_persistent_browser())
+    assert launches == ["ws://127.0.0.1:9222/devtools/browser/0"]
+    assert browser == launches[0]
+
+
+def test_concurrent_first_runs_launch_once():
+    """多个框架同时首次运行时只启动一个常驻浏览器，其余等待启动锁后复用"""
+    chromium, launches = FakeChromium(set()), []
+    frameworks = [make_framework(chromium, launches) for _ in range(3)]
+
+    async def main():
+        return await asyncio.gather(*(framework._connect_persistent_browser() for framework in frameworks))
+
+    browsers = asyncio.run(main())
+    assert launches == ["ws://127.0.0.1:9222/devtools/browser/0"]
+    assert browsers == launches * 3
+
+
+def test_read_endpoint_skips_pid_probe_on_windows(monkeypatch):
+    """Windows上不用os.kill探测进程，直接返回端点由连接结果决定"""
+    def kill(pid, sig):
+        raise AssertionError("Windows上不应调用os.kill")
+
+    monkeypatch.setattr(engine.os, "name", "nt")
+    monkeypatch.setattr(engine.os, "kill", kill)
+    write_endpoint(12345, "ws://127.0.0.1:9222/devtools/browser/a")
+    assert ReactiveAutomationFramework._read_persistent_endpoint() == "ws://127.0.0.1:9222/devtools/browser/a"
+
+
+def test_read_endpoint_returns_endpoint_when_probe_is_inconclusive(monkeypatch):
+    """探测进程时出现其他系统错误时照常返回端点"""
+    def kill(pid, sig):
+        raise OSError(22, "Invalid argument")
+
+    monkeypatch.setattr(engine.os, "kill", kill)
+    write_endpoint(12345, "ws://127.0.0.1:9222/devtools/browser/a")
+    assert ReactiveAutomationFramework._read_persistent_endpoint() == "ws://127.0.0.1:9222/devtools/browser/a"
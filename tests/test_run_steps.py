@@ -0,0 +1,473 @@
+import asyncio
+
+import pytest
+
+from py_cdp_reactive_flow_bot.engine import ReactiveAutomationFramework, TaskState, compile_step
+
+
+class FakePage:
+    url = "about:blank"
+
+    def __init__(self, failures=0, delay=0):
+        self.visited = []
+        self.closed = False
+        self.failures = failures
+        self.delay = delay
+
+    async def goto(self, url):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("导航失败")
+        await asyncio.sleep(self.delay)
+        self.visited.append(url)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeCDPSession:
+    def __init__(self):
+        self.commands = []
+        self.detached = False
+
+    async def send(self, command, params):
+        self.commands.append(command)
+        return {"command": command}
+
+    async def detach(self):
+        self.detached = True
+
+
+class FakeBrowserContext:
+    def __init__(self, page):
+        self.page = page
+        self.closed = False
+        self.cdp_sessions = []
+
+    async def new_page(self):
+        return self.page
+
+    async def clear_cookies(self):
+        self.cookies_cleared = True
+
+    async def new_cdp_session(self, page):
+        self.cdp_sessions.append(FakeCDPSession())
+        return self.cdp_sessions[-1]
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self, page):
+        self.browser_context = FakeBrowserContext(page)
+
+    async def new_context(self):
+        return self.browser_context
+
+
+def run_playbook(playbook, page):
+    """用假浏览器执行playbook，返回步骤结果、错误、状态更新以及浏览器上下文"""
+    async def main():
+        framework = ReactiveAutomationFramework()
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = FakeBrowser(page)
+        updates = []
+        framework.on_state(lambda update: updates.append((update["step_index"], update["state"])))
+        results, errors = [], []
+        done = asyncio.Event()
+
+        def on_error(error):
+            errors.append(error)
+            done.set()
+
+        framework.create_dsl_executor(playbook).subscribe(
+            on_next=results.append, on_error=on_error, on_completed=done.set
+        )
+        await asyncio.wait_for(done.wait(), 5)
+        return results, errors, updates, framework.browser.browser_context
+
+    return asyncio.run(main())
+
+
+def navigate(url, **settings):
+    return {"type": "navigate", "url": url, **settings}
+
+
+def test_run_steps_in_order():
+    """步骤按顺序执行，每个结果都发给观察者，结束后释放浏览器上下文"""
+    page = FakePage()
+    results, errors, updates, browser_context = run_playbook({"steps": [navigate("a"), navigate("b")]}, page)
+    assert errors == []
+    assert [r["url"] for r in results] == ["a", "b"]
+    assert page.visited == ["a", "b"]
+    assert updates == [(0, "running"), (0, "success"), (1, "running"), (1, "success")]
+    assert browser_context.closed
+
+
+def test_run_in_existing_context_closes_only_its_page():
+    """连接到已有浏览器时执行结束只关闭本次打开的标签页，保留用户的上下文"""
+    async def main():
+        page = FakePage()
+        browser_context = FakeBrowserContext(page)
+        framework = ReactiveAutomationFramework()
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = FakeBrowser(page)
+        framework._default_context = browser_context
+        done = asyncio.Event()
+        framework.create_dsl_executor({"steps": [navigate("a")]}).subscribe(on_completed=done.set)
+        await asyncio.wait_for(done.wait(), 5)
+        return page, browser_context
+
+    page, browser_context = asyncio.run(main())
+    assert page.visited == ["a"]
+    assert page.closed
+    assert not browser_context.closed
+
+
+def test_step_results_are_not_shared_between_runs():
+    """观察者修改步骤结果不影响之后的执行"""
+    async def main():
+        framework = ReactiveAutomationFramework()
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = FakeBrowser(FakePage())
+        executor = framework.create_dsl_executor({"steps": [navigate("a")]})
+        results = []
+        for _ in range(2):
+            done = asyncio.Event()
+
+            def on_next(result):
+                results.append(dict(result))
+                result["annotated"] = True
+
+            executor.subscribe(on_next=on_next, on_completed=done.set)
+            await asyncio.wait_for(done.wait(), 5)
+        return results
+
+    first, second = asyncio.run(main())
+    assert first == second == {"type": "navigation", "url": "a", "status": "success"}
+
+
+def test_run_steps_retries_failed_step():
+    """失败的步骤按max_retries重试"""
+    page = FakePage(failures=2)
+    results, errors, updates, _ = run_playbook({"steps": [navigate("a", max_retries=3)]}, page)
+    assert errors == []
+    assert page.visited == ["a"]
+    assert [state for _, state in updates].count("failed") == 2
+
+
+def test_run_steps_reports_exhausted_retries():
+    """重试次数用尽后错误发给观察者"""
+    page = FakePage(failures=5)
+    results, errors, _, browser_context = run_playbook({"steps": [navigate("a", max_retries=2)]}, page)
+    assert results == []
+    assert [str(e) for e in errors] == ["导航失败"]
+    assert page.failures == 3
+    assert browser_context.closed
+
+
+def test_run_steps_applies_step_timeout():
+    """配置了timeout的步骤超时后按失败处理"""
+    page = FakePage(delay=1)
+    _, errors, _, _ = run_playbook({"steps": [navigate("a", timeout=10, max_retries=1)]}, page)
+    assert isinstance(errors[0], TimeoutError)
+    assert "超过10ms" in str(errors[0])
+
+
+def test_run_steps_follows_next_step_patterns():
+    """命中跳转规则时从目标步骤继续执行"""
+    jump = {"pattern": {"field": "type", "value": "navigation"}, "goto_step": 2}
+    playbook = {"steps": [navigate("a", next_step_patterns=[jump]), navigate("b"), navigate("c")]}
+    page = FakePage()
+    results, errors, _, _ = run_playbook(playbook, page)
+    assert errors == []
+    assert page.visited == ["a", "c"]
+
+
+def test_type_routes_are_matched_on_event_loop():
+    """只比较结果类型的跳转规则直接在事件循环中匹配，包含data规则时才交给线程池"""
+    async def main():
+        framework = ReactiveAutomationFramework()
+        framework._loop = asyncio.get_running_loop()
+        calls = []
+        run_in_executor = framework._loop.run_in_executor
+
+        def spy(executor, func, *args):
+            calls.append(func)
+            return run_in_executor(executor, func, *args)
+
+        framework._loop.run_in_executor = spy
+        try:
+            type_jump = {"pattern": {"field": "type", "value": "navigation"}, "goto_step": 2}
+            data_jump = {"pattern": {"field": "data", "value": {"ok": True}}, "goto_step": 2}
+            result = {"type": "navigation", "data": {"ok": True}}
+            targets = []
+            for jump in (type_jump, data_jump):
+                step = compile_step(navigate("a", next_step_patterns=[jump]), 0)
+                targets.append(await framework._pattern_based_routing(result, step))
+                # 线程池在首次匹配data规则时才创建
+                targets.append((len(calls), framework._cpu_executor is not None))
+        finally:
+            del framework._loop.run_in_executor
+            await framework.close()
+        return targets
+
+    assert asyncio.run(main()) == [2, (0, False), 2, (1, True)]
+
+
+def test_run_steps_reuses_cdp_session():
+    """同一次执行中的CDP命令共用一个会话，执行结束后断开"""
+    playbook = {
+        "steps": [
+            {"type": "cdp_command", "command": "Page.enable"},
+            {"type": "cdp_command", "command": "Page.reload"},
+        ]
+    }
+    _, errors, _, browser_context = run_playbook(playbook, FakePage())
+    assert errors == []
+    assert len(browser_context.cdp_sessions) == 1
+    cdp_session = browser_context.cdp_sessions[0]
+    assert cdp_session.commands == ["Page.enable", "Page.reload"]
+    assert cdp_session.detached
+
+
+def test_wait_for_url_uses_compiled_pattern():
+    """url模式把编译好的正则交给 wait_for_url"""
+    class NavigatingPage(FakePage):
+        async def wait_for_url(self, url, timeout, wait_until):
+            self.url_pattern = url
+            self.url = "https://example.com/#done"
+
+    page = NavigatingPage()
+    playbook = {"steps": [{"type": "wait_for_pattern", "pattern": {"type": "url", "value": "#done$"}}]}
+    results, errors, _, _ = run_playbook(playbook, page)
+    assert errors == []
+    assert page.url_pattern.pattern == "#done$"
+    assert results[0]["match"] == {"type": "url", "matched": True, "url": "https://example.com/#done"}
+
+
+def test_extract_data_keeps_config_order():
+    """各提取方式并发执行，结果按配置项顺序返回"""
+    class ExtractPage(FakePage):
+        async def evaluate(self, script, selectors=None):
+            await asyncio.sleep(0.01)
+            return {"title": "标题", "heading": "标题一"}
+
+        async def content(self):
+            return "<html></html>"
+
+    extract = {
+        "html": {"method": "page_content"},
+        "title": {"method": "evaluate_js", "expression": "document.title"},
+        "metrics": {"method": "cdp", "command": "Performance.getMetrics"},
+        "heading": {"method": "selector_text", "selector": "h1"},
+    }
+    playbook = {"steps": [{"type": "extract_data", "extract": extract}]}
+    results, errors, _, browser_context = run_playbook(playbook, ExtractPage())
+    assert errors == []
+    data = results[0]["data"]
+    assert list(data) == ["html", "title", "metrics", "heading"]
+    assert data["metrics"] == {"command": "Performance.getMetrics"}
+    assert data["heading"] == "标题一"
+    assert len(browser_context.cdp_sessions) == 1
+
+
+def test_state_stream_supports_rx_style_subscribe():
+    """state_stream 兼容Rx的订阅方式，取消订阅后不再收到更新"""
+    framework = ReactiveAutomationFramework()
+    received = []
+    subscription = framework.state_stream.subscribe(on_next=received.append, on_error=print)
+    framework.state_stream.on_next(1)
+    subscription.dispose()
+    framework.state_stream.on_next(2)
+    assert received == [1]
+    assert not framework.state_stream
+
+
+def test_page_pool_reuses_pages_between_runs():
+    """启用页面池时页面在执行之间回收复用，关闭框架时才关闭"""
+    async def main():
+        page = FakePage()
+        framework = ReactiveAutomationFramework(page_pool_size=1)
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = FakeBrowser(page)
+        await framework._fill_page_pool()
+        browser_context = framework.browser.browser_context
+        for url in ("a", "b"):
+            done = asyncio.Event()
+            framework.create_dsl_executor({"steps": [navigate(url)]}).subscribe(on_completed=done.set)
+            await asyncio.wait_for(done.wait(), 5)
+            assert not browser_context.closed
+        assert page.visited == ["a", "about:blank", "b", "about:blank"]
+        assert browser_context.cookies_cleared
+        framework.browser = None
+        await framework.close()
+        assert browser_context.closed
+
+    asyncio.run(main())
+
+
+def test_page_pool_refills_after_failed_recycle():
+    """回收页面失败不影响本次执行结果，页面池不缩小，下次取出时重新创建页面"""
+    class BrokenPage(FakePage):
+        async def goto(self, url):
+            if url == "about:blank":
+                raise RuntimeError("页面已崩溃")
+            await super().goto(url)
+
+    async def main():
+        pages = [BrokenPage(), FakePage()]
+        new_context_failures = [RuntimeError("浏览器忙")]
+
+        class FlakyBrowser:
+            async def new_context(self):
+                if len(pages) == 1 and new_context_failures:
+                    raise new_context_failures.pop()
+                return FakeBrowserContext(pages.pop(0))
+
+        framework = ReactiveAutomationFramework(page_pool_size=1)
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = FlakyBrowser()
+        await framework._fill_page_pool()
+        outcomes = []
+        for url in ("a", "b", "c"):
+            done = asyncio.Event()
+
+            def on_error(error, done=done):
+                outcomes.append(str(error))
+                done.set()
+
+            def on_completed(done=done):
+                outcomes.append("completed")
+                done.set()
+
+            framework.create_dsl_executor({"steps": [navigate(url)]}).subscribe(
+                on_error=on_error, on_completed=on_completed
+            )
+            await asyncio.wait_for(done.wait(), 5)
+            assert framework._page_pool.qsize() == 1
+        return outcomes
+
+    assert asyncio.run(main()) == ["completed", "浏览器忙", "completed"]
+
+
+def test_page_recycled_during_close_is_closed():
+    """回收页面期间框架被关闭时关闭该页面，执行照常完成"""
+    async def main():
+        page = FakePage()
+        framework = ReactiveAutomationFramework(page_pool_size=1)
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = FakeBrowser(page)
+        await framework._fill_page_pool()
+        browser_context = framework.browser.browser_context
+        closing = []
+        goto = page.goto
+
+        async def goto_and_close(url):
+            # 回收时导航到空白页的过程中关闭框架
+            if url == "about:blank":
+                framework.browser = None
+                closing.append(asyncio.ensure_future(framework.close()))
+                await asyncio.sleep(0)
+            await goto(url)
+
+        page.goto = goto_and_close
+        done = asyncio.Event()
+        errors = []
+        framework.create_dsl_executor({"steps": [navigate("a")]}).subscribe(
+            on_error=errors.append, on_completed=done.set
+        )
+        await asyncio.wait_for(done.wait(), 5)
+        await closing[0]
+        return errors, browser_context.closed
+
+    assert asyncio.run(main()) == ([], True)
+
+
+def test_state_updates_are_flushed_in_batches():
+    """状态更新缓冲后在下一轮事件循环中按顺序发出"""
+    async def main():
+        framework = ReactiveAutomationFramework()
+        framework._loop = asyncio.get_running_loop()
+        received = []
+        framework.on_state(lambda update: received.append(update["step_index"]))
+        for i in range(3):
+            framework._emit_state_update(i, TaskState.RUNNING)
+        assert received == []
+        await asyncio.sleep(0)
+        assert received == [0, 1, 2]
+        # 缓冲区满时立即发出
+        for i in range(16):
+            framework._emit_state_update(i, TaskState.SUCCESS)
+        assert len(received) == 19
+
+    asyncio.run(main())
+
+
+def test_failing_state_subscriber_does_not_block_completion():
+    """状态订阅者抛出异常时只记录日志，其余订阅者照常收到全部更新，观察者照常收到完成通知"""
+    async def main():
+        framework = ReactiveAutomationFramework()
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = FakeBrowser(FakePage())
+
+        def broken(update):
+            raise RuntimeError("订阅者出错")
+
+        received = []
+        framework.on_state(broken)
+        framework.on_state(lambda update: received.append(update["state"]))
+        done = asyncio.Event()
+        errors = []
+        framework.create_dsl_executor({"steps": [navigate("a")]}).subscribe(
+            on_error=errors.append, on_completed=done.set
+        )
+        await asyncio.wait_for(done.wait(), 5)
+        return received, errors
+
+    assert asyncio.run(main()) == (["running", "success"], [])
+
+
+@pytest.mark.parametrize("goto_step", [-1, 2, True, 1.0, "1"])
+def test_create_executor_rejects_out_of_range_goto_step(goto_step):
+    """跳转目标不是整数或超出步骤列表范围时创建执行器失败"""
+    framework = ReactiveAutomationFramework()
+    framework.browser = FakeBrowser(FakePage())
+    jump = {"pattern": {"field": "type", "value": "navigation"}, "goto_step": goto_step}
+    with pytest.raises(ValueError, match="跳转目标无效"):
+        framework.create_dsl_executor({"steps": [navigate("a", next_step_patterns=[jump])]})
+
+
+def test_goto_step_equal_to_step_count_ends_run():
+    """跳转目标等于步骤数时跳到末尾，跳过剩余步骤正常结束"""
+    jump = {"pattern": {"field": "type", "value": "navigation"}, "goto_step": 3}
+    playbook = {"steps": [navigate("a", next_step_patterns=[jump]), navigate("b"), navigate("c")]}
+    page = FakePage()
+    results, errors, _, browser_context = run_playbook(playbook, page)
+    assert errors == []
+    assert page.visited == ["a"]
+    assert browser_context.closed
+
+
+def test_concurrent_runs_use_their_own_pages():
+    """同一个框架上并发执行的playbook各自在自己的页面上执行步骤"""
+    async def main():
+        page_a, page_b = FakePage(delay=0.02), FakePage(delay=0.01)
+        contexts = [FakeBrowserContext(page_a), FakeBrowserContext(page_b)]
+
+        class TwoContextBrowser:
+            async def new_context(self):
+                return contexts.pop(0)
+
+        framework = ReactiveAutomationFramework()
+        framework._loop = asyncio.get_running_loop()
+        framework.browser = TwoContextBrowser()
+        done = [asyncio.Event(), asyncio.Event()]
+        for name, event in zip("AB", done, strict=True):
+            playbook = {"steps": [navigate(f"{name}1"), navigate(f"{name}2")]}
+            framework.create_dsl_executor(playbook).subscribe(on_completed=event.set)
+        await asyncio.wait_for(asyncio.gather(*(event.wait() for event in done)), 5)
+        return page_a.visited, page_b.visited
+
+    assert asyncio.run(main()) == (["A1", "A2"], ["B1", "B2"])